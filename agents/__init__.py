@@ -1,3 +1,3 @@
-from .client import Client
-from .counselor import Counselor
-from .env import Env
\ No newline at end of file
+from .client import AsyncClient, Client
+from .counselor import AsyncCounselor, Counselor
+from .env import AsyncEnv, Env
@@ -0,0 +1,194 @@
+import contextvars
+import functools
+import inspect
+import json
+import threading
+
+# US dollars per million input, cached input and output tokens.
+PRICES = {
+    "gpt-3.5-turbo": (0.5, 0.5, 1.5),
+    "gpt-4": (30.0, 30.0, 60.0),
+    "gpt-4-turbo": (10.0, 10.0, 30.0),
+    "gpt-4o": (2.5, 1.25, 10.0),
+    "gpt-4o-mini": (0.15, 0.075, 0.6),
+    "gpt-4.1": (2.0, 0.5, 8.0),
+    "gpt-4.1-mini": (0.4, 0.1, 1.6),
+    "gpt-4.1-nano": (0.1, 0.025, 0.4),
+}
+COUNTERS = (
+    "calls",
+    "retries",
+    "cache_hits",
+    "latency",
+    "prompt_tokens",
+    "cached_tokens",
+    "completion_tokens",
+    "cost",
+    "unpriced_calls",
+)
+
+_prices = dict(PRICES)
+_ledger = contextvars.ContextVar("ledger", default=None)
+_step = contextvars.ContextVar("step", default=(None, None))
+
+
+def configure_prices(path):
+    # A JSON object of model -> [input, cached input, output] prices per million tokens,
+    # added to (or overriding) the built-in table.
+    with open(path) as f:
+        _prices.update({model: tuple(price) for model, price in json.load(f).items()})
+
+
+def model_price(model):
+    # Dated snapshots such as gpt-4o-2024-08-06 use the price of their longest listed prefix.
+    matches = [name for name in _prices if model == name or model.startswith(name + "-")]
+    return _prices[max(matches, key=len)] if matches else None
+
+
+def call_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    price = model_price(model)
+    if price is None:
+        return None
+    return (
+        (prompt_tokens - cached_tokens) * price[0]
+        + cached_tokens * price[1]
+        + completion_tokens * price[2]
+    ) / 1e6
+
+
+def accounted(agent, step):
+    # Tags the LLM calls made inside the decorated method with the agent and step.
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                token = _step.set((agent, step))
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _step.reset(token)
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                token = _step.set((agent, step))
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    _step.reset(token)
+
+        return wrapper
+
+    return decorate
+
+
+def new_counters():
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def add_counters(totals, counters):
+    for k, v in counters.items():
+        totals[k] = totals.get(k, 0) + v
+    return totals
+
+
+def merge_summaries(totals, summary):
+    add_counters(totals.setdefault("total", new_counters()), summary["total"])
+    for group in ("steps", "models"):
+        for key, counters in summary[group].items():
+            add_counters(totals.setdefault(group, {}).setdefault(key, new_counters()), counters)
+    return totals
+
+
+class Ledger:
+    # The calls of one conversation: running totals per agent step and per model, plus the
+    # calls not yet written to the call log.
+    def __init__(self, conversation=None):
+        self.conversation = conversation
+        self.turn = 0
+        self.summary = {"total": new_counters(), "steps": {}, "models": {}}
+        self.pending = []
+        self._lock = threading.Lock()
+
+    def record(self, model, latency, usage=None, error=None, cache_hit=False):
+        agent, step = _step.get()
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        cost = None
+        if usage is not None:
+            cost = call_cost(model, prompt_tokens, cached_tokens, completion_tokens)
+        call = {
+            "conversation": self.conversation,
+            "turn": self.turn,
+            "agent": agent,
+            "step": step,
+            "model": model,
+            "latency": latency,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+            "cache_hit": cache_hit,
+            "error": error,
+        }
+        counters = {
+            "calls": int(error is None),
+            "retries": int(error is not None),
+            "cache_hits": int(cache_hit),
+            "latency": latency,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost or 0,
+            "unpriced_calls": int(usage is not None and cost is None),
+        }
+        with self._lock:
+            add_counters(self.summary["total"], counters)
+            steps = self.summary["steps"]
+            add_counters(steps.setdefault(f"{agent}/{step}", new_counters()), counters)
+            add_counters(self.summary["models"].setdefault(model, new_counters()), counters)
+            self.pending.append(call)
+
+    def drain(self):
+        with self._lock:
+            calls, self.pending = self.pending, []
+        return calls
+
+    def state_dict(self):
+        with self._lock:
+            return json.loads(json.dumps(self.summary))
+
+    def load_state_dict(self, state):
+        with self._lock:
+            self.summary = json.loads(json.dumps(state))
+
+
+def track_calls(ledger):
+    # Calls made in this context, including tasks it starts, are recorded in `ledger`. Threads
+    # need contextvars.copy_context().run to inherit it.
+    return _ledger.set(ledger)
+
+
+def untrack_calls(token):
+    _ledger.reset(token)
+
+
+def current_ledger():
+    return _ledger.get()
+
+
+def format_summary(summary):
+    lines = []
+    for key, counters in sorted(summary.get("steps", {}).items()):
+        calls = counters["calls"] or 1
+        lines.append(
+            f"  {key:<28} {counters['calls']:>7} calls {counters['retries']:>5} retries "
+            f"{counters['latency'] / calls:>7.2f}s mean {counters['prompt_tokens']:>10} prompt "
+            f"{counters['cached_tokens']:>10} cached {counters['completion_tokens']:>8} completion "
+            f"${counters['cost']:.4f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,65 @@
+import math
+import re
+import threading
+from collections import Counter
+
+STOPWORDS = {
+    "a", "about", "all", "an", "and", "any", "are", "as", "at", "be", "been", "but", "by",
+    "can", "could", "did", "do", "does", "for", "from", "had", "has", "have", "how", "i",
+    "if", "in", "into", "is", "it", "its", "me", "my", "of", "on", "or", "so", "some",
+    "that", "the", "their", "them", "there", "these", "they", "this", "to", "was", "we",
+    "were", "what", "when", "which", "while", "who", "will", "with", "would", "you", "your",
+}
+
+
+def tokenize(text):
+    return [
+        token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(passage)) for passage in passages]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = sum(self.lengths) / max(len(self.lengths), 1)
+        doc_freqs = Counter()
+        for tf in self.term_freqs:
+            doc_freqs.update(tf.keys())
+        n = len(self.term_freqs)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    def scores(self, query):
+        terms = [term for term in tokenize(query) if term in self.idf]
+        scores = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term, 0)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            scores.append(score)
+        return scores
+
+    def rank(self, query):
+        scores = self.scores(query)
+        return sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def load_bm25_index(key, passages):
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = BM25Index(passages)
+            _indexes[key] = index
+    return index
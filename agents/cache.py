@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, accessed REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+            )
+
+    def _connect(self):
+        # One connection per thread; WAL and a busy timeout let several processes share the file.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def make_key(model, messages, temperature, top_p, max_tokens, response_format):
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "top_p": top_p,
+                "max_tokens": max_tokens,
+                "response_format": response_format,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        connection = self._connect()
+        row = connection.execute(
+            "SELECT response FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        with self._counter_lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key)
+        )
+        return row[0]
+
+    def reject(self, key):
+        # Drops an entry the caller could not use, so the lookup that found it counts as a miss.
+        self._connect().execute("DELETE FROM responses WHERE key = ?", (key,))
+        with self._counter_lock:
+            self.hits -= 1
+            self.misses += 1
+
+    def put(self, key, model, response):
+        connection = self._connect()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            (count,) = connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                # Evict the least recently used entries.
+                connection.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        with self._counter_lock:
+            return {"hits": self.hits, "misses": self.misses}
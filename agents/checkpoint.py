@@ -0,0 +1,35 @@
+import os
+import pickle
+import tempfile
+from .profiling import timed
+
+
+@timed("io")
+def save_checkpoint(path, state):
+    # Write to a temporary file in the same directory and rename it over the old checkpoint,
+    # so a crash never leaves a half-written checkpoint behind.
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def remove_checkpoint(path):
+    if os.path.exists(path):
+        os.remove(path)
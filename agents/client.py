@@ -1,17 +1,26 @@
+import asyncio
 import backoff
+import contextvars
 import openai
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import numpy as np
 import os
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import heapq
+import json
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .accounting import accounted
+from .bm25 import load_bm25_index
+from .llm import acreate_chat_completion, create_chat_completion
+from .profiling import timed
+from .retriever import load_embedder, load_passage_index, load_retriever
+from .topics import load_knowledge_base
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 
 openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
 
 @backoff.on_exception(
@@ -24,8 +33,13 @@ openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
         openai.APIStatusError,
     ),
 )
-def get_precise_response(messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1):
-    message = openai_client.chat.completions.create(
+def get_precise_response(
+    messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1, accept=None
+):
+    message = create_chat_completion(
+        openai_client,
+        cache=True,
+        accept=accept,
         model=model,
         messages=messages,
         temperature=temperature,
@@ -47,7 +61,83 @@ def get_precise_response(messages, model="gpt-3.5-turbo-0125", temperature=0.2,
 def get_chatbot_response(
     messages, model="gpt-3.5-turbo-0125", temperature=0.7, top_p=0.8, max_tokens=100
 ):
-    message = openai_client.chat.completions.create(
+    message = create_chat_completion(
+        openai_client,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=100,
+    )
+    return message.choices[0].message.content
+
+
+@backoff.on_exception(
+    backoff.expo,
+    (
+        openai.RateLimitError,
+        openai.Timeout,
+        openai.APIError,
+        openai.APIConnectionError,
+        openai.APIStatusError,
+    ),
+)
+def get_json_response(
+    messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1, accept=None
+):
+    message = create_chat_completion(
+        openai_client,
+        cache=True,
+        accept=accept,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        top_p=top_p,
+        response_format={"type": "json_object"},
+    )
+    return message.choices[0].message.content
+
+
+@backoff.on_exception(
+    backoff.expo,
+    (
+        openai.RateLimitError,
+        openai.Timeout,
+        openai.APIError,
+        openai.APIConnectionError,
+        openai.APIStatusError,
+    ),
+)
+async def aget_precise_response(
+    messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1, accept=None
+):
+    message = await acreate_chat_completion(
+        async_openai_client,
+        cache=True,
+        accept=accept,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        top_p=top_p,
+    )
+    return message.choices[0].message.content
+
+
+@backoff.on_exception(
+    backoff.expo,
+    (
+        openai.RateLimitError,
+        openai.Timeout,
+        openai.APIError,
+        openai.APIConnectionError,
+        openai.APIStatusError,
+    ),
+)
+async def aget_chatbot_response(
+    messages, model="gpt-3.5-turbo-0125", temperature=0.7, top_p=0.8, max_tokens=100
+):
+    message = await acreate_chat_completion(
+        async_openai_client,
         model=model,
         messages=messages,
         temperature=temperature,
@@ -67,8 +157,13 @@ def get_chatbot_response(
         openai.APIStatusError,
     ),
 )
-def get_json_response(messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1):
-    message = openai_client.chat.completions.create(
+async def aget_json_response(
+    messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1, accept=None
+):
+    message = await acreate_chat_completion(
+        async_openai_client,
+        cache=True,
+        accept=accept,
         model=model,
         messages=messages,
         temperature=temperature,
@@ -78,14 +173,68 @@ def get_json_response(messages, model="gpt-3.5-turbo-0125", temperature=0.2, top
     return message.choices[0].message.content
 
 
+_step_executor = None
+_step_executor_lock = threading.Lock()
+
+
+def get_step_executor():
+    global _step_executor
+    with _step_executor_lock:
+        if _step_executor is None:
+            _step_executor = ThreadPoolExecutor(max_workers=8)
+    return _step_executor
+
+
+CLIENT_GUIDELINES = """Please follow these guidelines in your responses:
+- **Start your response with "Client: "**
+- **Adhere strictly to the state, action and persona specified within square brackets.**
+- **Keep your responses coherent and concise, similar to the reference conversation and no more than 3 sentences.**
+- **Be natural and concise without being overly polite.**
+- **Stick to the persona provided and avoid introducing contradictive details.**
+"""
+
+
+@timed("prompt")
+def client_system_prompt(behavior, goal, reference, personas, beliefs, layout="default"):
+    profile = f"""In this role-play scenario, you'll take on the role of a Client discussing about your {behavior} where the Counselor's goal is {goal}.
+
+Here is your personas which you need to follow consistently throughout the conversation:
+[@personas]
+
+Here is a conversation occurs in parallel world between you (Client) and Counselor, where you can follow the style and information provided in the conversation:
+{reference}
+"""
+    if layout == "prefix":
+        # The guidelines are the same for every client, so they go first and the prompt shares
+        # its opening tokens with every other profile.
+        system_prompt = f"{CLIENT_GUIDELINES}\n{profile}"
+    else:
+        system_prompt = f"{profile}\n{CLIENT_GUIDELINES}"
+    system_prompt = system_prompt.replace(
+        "[@personas]", "- " + "\n- ".join(personas) + "\n-".join(beliefs)
+    )
+    return system_prompt
+
+
 stage2description = {
     "Precontemplation": "The client doesn't think their behavior is problematic.",
     "Contemplation": "The client feels that their behavior is problematic, but still hesitate whether to change.",
     "Preparation": "The client begins discuss about steps toward behavior change.",
 }
 
-
 class Client:
+    information_actions = {
+        "Precontemplation": ("Inform", "Downplay", "Blame"),
+        "Contemplation": ("Hesitate", "Inform"),
+        "Preparation": ("Inform",),
+    }
+    information_criteria = {
+        "Inform": "answer the question",
+        "Downplay": "reply the question to downplay the importance or impact of behavior",
+        "Blame": "reply the question to blame external factors or others to justify",
+        "Hesitate": "reply the question to show uncertainty, indicating ambivalence about change",
+    }
+
     def __init__(
         self,
         goal,
@@ -100,7 +249,21 @@ class Client:
         receptivity,
         model,
         wikipedia_dir,
-        retriever_path
+        retriever_path,
+        retriever_device=None,
+        embedder_path=None,
+        embedding_index=None,
+        rerank_top_k=0,
+        bm25_candidates=0,
+        measure_agreement=False,
+        concurrent_steps=False,
+        speculative_information=0,
+        information_mode="sequential",
+        fused_decision=False,
+        system_prompt=None,
+        history=None,
+        prompt_layout="default",
+        seed=None,
     ):
         self.goal = goal
         self.behavior = behavior
@@ -139,463 +302,68 @@ class Client:
             "Preparation": "You gets ready to take action to change and begins discuss about steps toward {self.goal}.",
         }
 
-        self.topic2description = {
-            "Infection": f"When discussing [topic], The counselor may discuss how {self.behavior} can weaken your immune system, making you more susceptible to infections. They may also talk about how {self.goal} can help strengthen your immune system and reduce your risk of frequent or severe infections.",
-            "Hypertension": f"When discussing [topic], The counselor may explore how {self.behavior} can contribute to increased blood pressure and raise your risk of hypertension. They may also discuss how {self.goal} can help maintain a healthier blood pressure level and lower your risk of complications from hypertension.",
-            "Flu": f"When discussing [topic], The counselor may explain how {self.behavior} can increase your chances of contracting the flu or experiencing more severe symptoms. They may also highlight how {self.goal} can improve your immune defense, reducing your likelihood of catching the flu or lessening its impact.",
-            "Inflammation": f"When discussing [topic], The counselor may address how {self.behavior} can lead to chronic inflammation in your body, increasing your risk for related health conditions. They may also discuss how {self.goal} can help reduce inflammation and promote better long-term health.",
-            "Liver Disease": f"When discussing [topic], The counselor may explore how {self.behavior} can cause liver damage, increasing your risk of liver disease. They may also discuss how {self.goal} can protect your liver, prevent damage, and lower your chances of developing serious liver conditions.",
-            "Lung Cancer": f"When discussing [topic], The counselor may discuss how {self.behavior} can increase your risk of developing lung cancer. They may also highlight how {self.goal} can reduce your risk of lung cancer and improve your overall respiratory health.",
-            "COPD": f"When discussing [topic], The counselor may explore how {self.behavior} can worsen symptoms of COPD, making it harder for you to breathe. They may also explain how {self.goal} can improve your lung function and help manage COPD symptoms.",
-            "Asthma": f"When discussing [topic], The counselor may explain how {self.behavior} can trigger or worsen asthma attacks. They may also discuss how {self.goal} can help control asthma symptoms and improve your ability to manage the condition.",
-            "Stroke": f"When discussing [topic], The counselor may address how {self.behavior} can increase your risk of stroke by negatively impacting your cardiovascular health. They may also highlight how {self.goal} can help reduce this risk and support a healthier cardiovascular system.",
-            "Diabetes": f"When discussing [topic], The counselor may explore how {self.behavior} can contribute to the development or worsening of diabetes. They may also discuss how {self.goal} can help manage your blood sugar levels and reduce the risk of diabetes-related complications.",
-            "Physical Activity": f"When discussing [topic], The counselor may discuss how {self.behavior} can reduce your physical activity levels, increasing your risk of various health problems. They may also explain how {self.goal} can boost your physical activity, improving your fitness and overall health.",
-            "Sport": f"When discussing [topic], The counselor may explain how {self.behavior} can decrease your performance or participation in sports. They may also discuss how {self.goal} can enhance your physical conditioning and boost your ability to engage in sporting activities.",
-            "Physical Fitness": f"When discussing [topic], The counselor may discuss how {self.behavior} can negatively affect your physical fitness, reducing your overall health. They may also explain how {self.goal} can improve your fitness level and contribute to better health and well-being.",
-            "Strength": f"When discussing [topic], The counselor may explore how {self.behavior} can lead to a loss of strength, making everyday tasks more difficult. They may also discuss how {self.goal} can help you build or regain muscle strength.",
-            "Flexibility": f"When discussing [topic], The counselor may explain how {self.behavior} can reduce your flexibility, causing stiffness or discomfort. They may also highlight how {self.goal} can improve your flexibility, making movement easier and reducing the risk of injury.",
-            "Endurance": f"When discussing [topic], The counselor may discuss how {self.behavior} can lower your endurance, making it harder to sustain physical activities for long periods. They may also explore how {self.goal} can improve your stamina and overall physical endurance.",
-            "Dentistry": f"When discussing [topic], The counselor may address how {self.behavior} can lead to poor dental hygiene, increasing your risk of cavities or gum disease. They may also explain how {self.goal} can improve your oral health and reduce the likelihood of dental problems.",
-            "Caregiver Burden": f"When discussing [topic], The counselor may explore how {self.behavior} can place additional stress on caregivers, leading to burnout or reduced quality of care. They may also discuss how {self.goal} can alleviate the burden on caregivers and improve the care provided.",
-            "Independent Living": f"When discussing [topic], The counselor may explain how {self.behavior} can limit your ability to live independently, making you more reliant on others. They may also discuss how {self.goal} can help you regain independence and improve your quality of life.",
-            "Human Appearance": f"When discussing [topic], The counselor may address how {self.behavior} can negatively impact your appearance, such as causing skin issues or weight gain. They may also explain how {self.goal} can improve your physical appearance and boost your self-confidence.",
-            "Depression": f"When discussing [topic], The counselor may explore how {self.behavior} can worsen symptoms of depression, affecting your mood and daily life. They may also discuss how {self.goal} can improve your emotional well-being and reduce the impact of depression.",
-            "Chronodisruption": f"When discussing [topic], The counselor may explain how {self.behavior} can disrupt your body’s natural rhythms, leading to sleep problems or fatigue. They may also highlight how {self.goal} can restore healthy sleep patterns and improve your overall well-being.",
-            "Anxiety Disorders": f"When discussing [topic], The counselor may explore how {self.behavior} can increase your anxiety, leading to stress and panic attacks. They may also discuss how {self.goal} can help manage anxiety and promote emotional stability.",
-            "Cognitive Decline": f"When discussing [topic], The counselor may discuss how {self.behavior} can accelerate cognitive decline, affecting your memory and thinking abilities. They may also highlight how {self.goal} can help protect brain function and slow cognitive deterioration.",
-            "Safe Sex": f"When discussing [topic], The counselor may explain how {self.behavior} can increase your risk of sexually transmitted infections or unintended pregnancies. They may also discuss how {self.goal} can promote safer sexual practices and reduce these risks.",
-            "Maternal Health": f"When discussing [topic], The counselor may address how {self.behavior} can negatively affect your health during pregnancy, increasing the risk of complications. They may also discuss how {self.goal} can support a healthier pregnancy and reduce the likelihood of problems during childbirth.",
-            "Preterm Birth": f"When discussing [topic], The counselor may explore how {self.behavior} can increase the risk of preterm birth, leading to complications for both mother and baby. They may also highlight how {self.goal} can help ensure a full-term, healthy pregnancy.",
-            "Miscarriage": f"When discussing [topic], The counselor may explain how {self.behavior} can increase the risk of miscarriage, causing emotional and physical distress. They may also discuss how {self.goal} can help support a healthy pregnancy and reduce miscarriage risk.",
-            "Birth Defects": f"When discussing [topic], The counselor may address how {self.behavior} can raise the risk of birth defects during pregnancy. They may also explain how {self.goal} can promote a healthier pregnancy and reduce the risk of complications.",
-            "Productivity": f"When discussing [topic], The counselor may explore how {self.behavior} can negatively affect your productivity at work, making it harder to perform well. They may also discuss how {self.goal} can improve your focus and efficiency.",
-            "Absenteeism": f"When discussing [topic], The counselor may explain how {self.behavior} can increase absenteeism, causing you to miss work or other responsibilities. They may also highlight how {self.goal} can help you be more consistent and present in your daily life.",
-            "Workplace Relationships": f"When discussing [topic], The counselor may discuss how {self.behavior} can strain relationships with colleagues, leading to conflicts at work. They may also explain how {self.goal} can help improve communication and foster positive workplace relationships.",
-            "Career Break": f"When discussing [topic], The counselor may address how {self.behavior} can lead to career interruptions or breaks, affecting your professional progress. They may also discuss how {self.goal} can help you maintain continuity in your career.",
-            "Career Assessment": f"When discussing [topic], The counselor may explain how {self.behavior} can affect career assessments, leading to negative evaluations or feedback. They may also highlight how {self.goal} can improve your performance and result in more favorable assessments.",
-            "Absence Rate": f"When discussing [topic], The counselor may explore how {self.behavior} can increase your absence rate at work, impacting your job security. They may also discuss how {self.goal} can help you reduce absences and improve your work attendance.",
-            "Salary": f"When discussing [topic], The counselor may address how {self.behavior} can hinder salary progression, limiting your earning potential. They may also discuss how {self.goal} can help you increase your salary and financial stability.",
-            "Workplace Wellness": f"When discussing [topic], The counselor may discuss how {self.behavior} can undermine workplace wellness initiatives, affecting your health at work. They may also explain how {self.goal} can help you benefit from wellness programs and improve your job satisfaction.",
-            "Workplace Incivility": f"When discussing [topic], The counselor may explore how {self.behavior} can contribute to incivility in the workplace, leading to a negative environment. They may also highlight how {self.goal} can help promote respect and cooperation in your work setting.",
-            "Cost of Living": f"When discussing [topic], The counselor may discuss how {self.behavior} can make it harder to manage the cost of living, leading to financial strain. They may also explain how {self.goal} can help improve your financial situation and reduce stress related to expenses.",
-            "Personal Budget": f"When discussing [topic], The counselor may address how {self.behavior} can make it difficult to stick to a personal budget, leading to financial instability. They may also discuss how {self.goal} can help you manage your finances more effectively.",
-            "Debt": f"When discussing [topic], The counselor may explain how {self.behavior} can lead to increased debt, affecting your financial security. They may also discuss how {self.goal} can help you reduce debt and improve your financial well-being.",
-            "Income Deficit": f"When discussing [topic], The counselor may explore how {self.behavior} can contribute to income deficits, making it harder to cover basic expenses. They may also explain how {self.goal} can help improve your financial management and income stability.",
-            "Family Estrangement": f"When discussing [topic], The counselor may discuss how {self.behavior} can lead to emotional or physical distance between family members. They may also highlight how {self.goal} can help repair family relationships and promote reconciliation.",
-            "Family Disruption": f"When discussing [topic], The counselor may explain how {self.behavior} can disrupt family dynamics, leading to conflict or instability. They may also discuss how {self.goal} can strengthen family bonds and promote harmony.",
-            "Divorce": f"When discussing [topic], The counselor may address how {self.behavior} can contribute to marital conflict, potentially leading to divorce. They may also discuss how {self.goal} can improve communication and reduce the risk of divorce.",
-            "Role Model": f"When discussing [topic], The counselor may explain how {self.behavior} can affect your ability to serve as a positive role model, particularly for your children. They may also highlight how {self.goal} can help you set a better example for those who look up to you.",
-            "Child Development": f"When discussing [topic], The counselor may discuss how {self.behavior} can impact your child’s emotional, social, or cognitive development. They may also explain how {self.goal} can support healthier growth and development in your child.",
-            "Paternal Bond": f"When discussing [topic], The counselor may explore how {self.behavior} can weaken the bond between you and your child, affecting your relationship. They may also discuss how {self.goal} can help strengthen this bond and promote a closer connection.",
-            "Child Care": f"When discussing [topic], The counselor may explain how {self.behavior} can interfere with your ability to provide consistent child care. They may also highlight how {self.goal} can help you offer more stable and nurturing care for your child.",
-            "Habituation": f"When discussing [topic], The counselor may discuss how {self.behavior} can negatively affect a child’s ability to develop healthy habits or adapt to new environments. They may also explain how {self.goal} can support positive habituation and learning.",
-            "Arrest": f"When discussing [topic], The counselor may address how {self.behavior} can increase your risk of arrest, leading to legal trouble. They may also highlight how {self.goal} can help you avoid legal issues and stay on the right side of the law.",
-            "Imprisonment": f"When discussing [topic], The counselor may explain how {self.behavior} can lead to imprisonment, causing long-term legal and social consequences. They may also discuss how {self.goal} can help you avoid incarceration and promote responsible behavior.",
-            "Child Custody": f"When discussing [topic], The counselor may explore how {self.behavior} can affect your ability to maintain child custody, leading to legal challenges. They may also discuss how {self.goal} can help you improve your parenting abilities and secure your custody rights.",
-            "Traffic Ticket": f"When discussing [topic], The counselor may address how {self.behavior} can increase your chances of receiving traffic tickets or other legal penalties. They may also discuss how {self.goal} can help you adopt safer driving practices and avoid infractions.",
-            "Complaint": f"When discussing [topic], The counselor may explain how {self.behavior} can result in legal complaints or disputes. They may also highlight how {self.goal} can help you reduce conflicts and maintain positive relationships with others.",
-            "Attendance": f"When discussing [topic], The counselor may explore how {self.behavior} can affect your attendance, causing you to miss school or other responsibilities. They may also discuss how {self.goal} can help you improve your attendance and stay on track.",
-            "Suspension": f"When discussing [topic], The counselor may explain how {self.behavior} can lead to suspension from school, affecting your academic progress. They may also highlight how {self.goal} can help you avoid disciplinary actions and stay engaged in school.",
-            "Scholarship": f"When discussing [topic], The counselor may address how {self.behavior} can reduce your eligibility for scholarships, limiting academic opportunities. They may also discuss how {self.goal} can help improve your academic performance and increase your chances of receiving scholarships.",
-            "Exam": f"When discussing [topic], The counselor may discuss how {self.behavior} can negatively impact your exam preparation and performance, leading to lower grades. They may also explain how {self.goal} can help improve your focus and exam results.",
-            "Health": f"When discussing [topic], The counselor may talk about how {self.behavior} affects your overall health, including physical, mental, and emotional well-being. They may focus on specific health conditions, fitness levels, mental health, or healthcare practices. The counselor can also discuss how {self.goal} can improve your health and reduce risks.",
-            "Diseases": f"When discussing [topic], The counselor may talk about how {self.behavior} leads to specific health conditions, such as infections, hypertension, flu, inflammation, liver disease, lung cancer, chronic obstructive pulmonary disease (COPD), asthma, stroke, and diabetes. The counselor can also discuss how {self.goal} can help prevent or manage these diseases.",
-            "Fitness": f"When discussing [topic], The counselor may talk about how {self.behavior} reduces your physical activity, strength, flexibility, or endurance. The counselor can also discuss how {self.goal} can improve your fitness and overall physical health.",
-            "Health Care": f"When discussing [topic], The counselor may talk about how {self.behavior} affects your ability to maintain personal healthcare, such as dental hygiene, caregiver burden, independent living, or human appearance. The counselor can also discuss how {self.goal} can improve your self-care and healthcare routines.",
-            "Mental Disorders": f"When discussing [topic], The counselor may talk about how {self.behavior} contributes to mental health issues, such as depression, chronodisruption, anxiety disorders, or cognitive decline. The counselor can also discuss how {self.goal} can improve your emotional well-being and cognitive health.",
-            "Sexual Health": f"When discussing [topic], The counselor may talk about how {self.behavior} affects your sexual and reproductive health, including safe sex practices, maternal health, preterm birth, miscarriage, or birth defects. The counselor can also discuss how {self.goal} can help reduce risks and support a healthier sexual lifestyle.",
-            "Economy": f"When discussing [topic], The counselor may talk about how {self.behavior} impacts your financial stability, job performance, or overall economic well-being. They may discuss issues like work productivity, financial management, or income deficits. The counselor can also discuss how {self.goal} can improve your financial situation and career success.",
-            "Employment": f"When discussing [topic], The counselor may talk about how {self.behavior} affects your job performance, including productivity, absenteeism, workplace relationships, career breaks, career assessments, absence rates, salary, workplace wellness, or workplace incivility. The counselor can also discuss how {self.goal} can improve your professional performance and career progression.",
-            "Personal Finance": f"When discussing [topic], The counselor may talk about how {self.behavior} impacts your personal finances, including budgeting, debt management, cost of living, or income deficits. The counselor can also discuss how {self.goal} can improve your financial stability and reduce financial stress.",
-            "Interpersonal Relationships": f"When discussing [topic], The counselor may talk about how {self.behavior} affects your relationships with family, children, or others. They may focus on how family dynamics, parenting roles, or conflicts are influenced by your actions. The counselor can also discuss how {self.goal} can help strengthen relationships and foster positive connections.",
-            "Family": f"When discussing [topic], The counselor may talk about how {self.behavior} leads to family estrangement, family disruption, or divorce. The counselor can also discuss how {self.goal} can help resolve family conflicts and improve relationships.",
-            "Parenting": f"When discussing [topic], The counselor may talk about how {self.behavior} affects your parenting style and your child’s development, including role modeling, paternal bonding, child care, or habituation. The counselor can also discuss how {self.goal} can improve your parenting and support your child’s growth.",
-            "Law": f"When discussing [topic], The counselor may talk about how {self.behavior} may lead to legal issues, such as arrests, traffic violations, or family law disputes. They may focus on the consequences of these actions and the risks involved. The counselor can also discuss how {self.goal} can help you avoid legal trouble and promote a law-abiding lifestyle.",
-            "Criminal Law": f"When discussing [topic], The counselor may talk about how {self.behavior} can lead to legal consequences, such as arrest, imprisonment, or complaints. The counselor can also discuss how {self.goal} can help avoid these situations and promote responsible behavior.",
-            "Family Law": f"When discussing [topic], The counselor may talk about how {self.behavior} affects family law matters, such as child custody disputes. The counselor can also discuss how {self.goal} can improve your parenting and strengthen your legal position.",
-            "Traffic Law": f"When discussing [topic], The counselor may talk about how {self.behavior} increases your chances of receiving traffic tickets or fines. The counselor can also discuss how {self.goal} can help you drive responsibly and avoid future violations.",
-            "Education": f"When discussing [topic], The counselor may talk about how {self.behavior} affects your academic performance and opportunities, such as attendance, exam results, or scholarship eligibility. They may focus on how these behaviors hinder your educational success. The counselor can also discuss how {self.goal} can help you improve your academic performance and stay engaged in school.",
-            "Student Affairs": f"When discussing [topic], The counselor may talk about how {self.behavior} impacts your attendance, causes suspensions, or affects your eligibility for scholarships. The counselor can also discuss how {self.goal} can help improve your participation and academic success.",
-            "Academic Achievement": f"When discussing [topic], The counselor may talk about how {self.behavior} affects your academic performance or productivity in study. The counselor can also discuss how {self.goal} can help you achieve better grades and academic success.",
-        }
-
-        self.topic_graph = {
-            "Health": {
-                "Mental Disorders": 2,
-                "Diseases": 2,
-                "Sexual Health": 2,
-                "Fitness": 2,
-                "Health Care": 2,
-                "Workplace Wellness": 1,
-                "Interpersonal Relationships": 3,
-                "Law": 3,
-                "Economy": 3,
-                "Education": 3,
-            },
-            "Interpersonal Relationships": {
-                "Parenting": 2,
-                "Family": 2,
-                "Health": 3,
-                "Law": 3,
-                "Economy": 3,
-                "Education": 3,
-                "Workplace Relationships": 1,
-            },
-            "Law": {
-                "Child Custody": 1,
-                "Traffic Ticket": 1,
-                "Criminal Law": 2,
-                "Health": 3,
-                "Interpersonal Relationships": 3,
-                "Economy": 3,
-                "Education": 3,
-            },
-            "Economy": {
-                "Personal Finance": 2,
-                "Employment": 2,
-                "Family": 3,
-                "Law": 3,
-                "Health": 3,
-                "Interpersonal Relationships": 3,
-                "Education": 3,
-            },
-            "Education": {
-                "Academic Achievement": 1,
-                "Student Affairs": 2,
-                "Exam": 1,
-                "Health": 3,
-                "Interpersonal Relationships": 3,
-                "Law": 3,
-                "Economy": 3,
-            },
-            "Student Affairs": {
-                "Attendance": 1,
-                "Suspension": 1,
-                "Scholarship": 1,
-                "Education": 2,
-            },
-            "Exam": {
-                "Education": 2,
-            },
-            "Academic Achievement": {
-                "Education": 2,
-            },
-            "Scholarship": {
-                "Student Affairs": 1,
-            },
-            "Suspension": {
-                "Student Affairs": 1,
-            },
-            "Attendance": {
-                "Student Affairs": 1,
-            },
-            "Employment": {
-                "Economy": 2,
-                "Productivity": 1,
-                "Absenteeism": 1,
-                "Career Assessment": 1,
-                "Absence Rate": 1,
-                "Career Break": 1,
-                "Salary": 1,
-                "Workplace Wellness": 1,
-                "Workplace Relationships": 1,
-                "Workplace Incivility": 1,
-            },
-            "Productivity": {
-                "Employment": 1,
-            },
-            "Absenteeism": {
-                "Employment": 1,
-            },
-            "Career Assessment": {
-                "Employment": 1,
-            },
-            "Absence Rate": {
-                "Employment": 1,
-            },
-            "Career Break": {
-                "Employment": 1,
-            },
-            "Salary": {
-                "Employment": 1,
-            },
-            "Workplace Wellness": {
-                "Employment": 1,
-                "Health": 1,
-            },
-            "Workplace Relationships": {
-                "Employment": 1,
-                "Interpersonal Relationships": 1,
-            },
-            "Workplace Incivility": {
-                "Employment": 1,
-            },
-            "Personal Finance": {
-                "Economy": 2,
-                "Debt": 1,
-                "Cost of Living": 1,
-                "Income Deficit": 1,
-                "Personal Budget": 1,
-            },
-            "Debt": {
-                "Personal Finance": 1,
-            },
-            "Cost of Living": {
-                "Personal Finance": 1,
-            },
-            "Income Deficit": {
-                "Personal Finance": 1,
-            },
-            "Personal Budget": {
-                "Personal Finance": 1,
-            },
-            "Criminal Law": {
-                "Law": 2,
-                "Arrest": 1,
-                "Complaint": 1,
-                "Imprisonment": 1,
-            },
-            "Arrest": {
-                "Criminal Law": 1,
-            },
-            "Complaint": {
-                "Criminal Law": 1,
-            },
-            "Imprisonment": {
-                "Criminal Law": 1,
-            },
-            "Traffic Ticket": {
-                "Law": 1,
-            },
-            "Child Custody": {
-                "Law": 1,
-                "Family": 1,
-                "Parenting": 1,
-            },
-            "Family": {
-                "Interpersonal Relationships": 2,
-                "Family Estrangement": 1,
-                "Family Disruption": 1,
-                "Divorce": 1,
-                "Child Custody": 1,
-            },
-            "Family Estrangement": {
-                "Family": 1,
-            },
-            "Family Disruption": {
-                "Family": 1,
-            },
-            "Divorce": {
-                "Family": 1,
-            },
-            "Parenting": {
-                "Interpersonal Relationships": 2,
-                "Role Model": 1,
-                "Child Development": 1,
-                "Paternal Bond": 1,
-                "Child Care": 1,
-                "Habituation": 1,
-                "Child Custody": 1,
-            },
-            "Role Model": {
-                "Parenting": 1,
-            },
-            "Child Development": {
-                "Parenting": 1,
-            },
-            "Paternal Bond": {
-                "Parenting": 1,
-            },
-            "Child Care": {
-                "Parenting": 1,
-                "Health Care": 1,
-            },
-            "Habituation": {
-                "Parenting": 1,
-            },
-            "Health Care": {
-                "Health": 2,
-                "Dentistry": 1,
-                "Caregiver Burden": 1,
-                "Independent Living": 1,
-                "Human Appearance": 1,
-                "Child Care": 1,
-                "Maternal Health": 1,
-            },
-            "Dentistry": {
-                "Health Care": 1,
-            },
-            "Caregiver Burden": {
-                "Health Care": 1,
-            },
-            "Independent Living": {
-                "Health Care": 1,
-            },
-            "Human Appearance": {
-                "Health Care": 1,
-            },
-            "Fitness": {
-                "Health": 2,
-                "Strength": 1,
-                "Flexibility": 1,
-                "Endurance": 1,
-                "Sport": 1,
-                "Physical Activity": 1,
-                "Physical Fitness": 1,
-            },
-            "Strength": {
-                "Fitness": 1,
-            },
-            "Flexibility": {
-                "Fitness": 1,
-            },
-            "Endurance": {
-                "Fitness": 1,
-            },
-            "Sport": {
-                "Fitness": 1,
-            },
-            "Physical Activity": {
-                "Fitness": 1,
-            },
-            "Physical Fitness": {
-                "Fitness": 1,
-            },
-            "Sexual Health": {
-                "Health": 2,
-                "Maternal Health": 1,
-                "Miscarriage": 1,
-                "Safe Sex": 1,
-                "Birth Defects": 1,
-                "Preterm Birth": 1,
-            },
-            "Maternal Health": {
-                "Sexual Health": 1,
-                "Health Care": 1,
-            },
-            "Miscarriage": {
-                "Sexual Health": 1,
-            },
-            "Safe Sex": {
-                "Sexual Health": 1,
-            },
-            "Birth Defects": {
-                "Sexual Health": 1,
-            },
-            "Preterm Birth": {
-                "Sexual Health": 1,
-            },
-            "Mental Disorders": {
-                "Health": 2,
-                "Depression": 1,
-                "Chronodisruption": 1,
-                "Anxiety Disorders": 1,
-                "Cognitive Decline": 1,
-            },
-            "Depression": {
-                "Mental Disorders": 1,
-            },
-            "Chronodisruption": {
-                "Mental Disorders": 1,
-            },
-            "Anxiety Disorders": {
-                "Mental Disorders": 1,
-            },
-            "Cognitive Decline": {
-                "Mental Disorders": 1,
-            },
-            "Diseases": {
-                "Health": 2,
-                "Infection": 1,
-                "Hypertension": 1,
-                "Flu": 1,
-                "Inflammation": 1,
-                "Liver Disease": 1,
-                "Lung Cancer": 1,
-                "COPD": 1,
-                "Asthma": 1,
-                "Stroke": 1,
-                "Diabetes": 1,
-            },
-            "Infection": {
-                "Diseases": 1,
-            },
-            "Hypertension": {
-                "Diseases": 1,
-            },
-            "Flu": {
-                "Diseases": 1,
-            },
-            "Inflammation": {
-                "Diseases": 1,
-            },
-            "Liver Disease": {
-                "Diseases": 1,
-            },
-            "Lung Cancer": {
-                "Diseases": 1,
-            },
-            "COPD": {
-                "Diseases": 1,
-            },
-            "Asthma": {
-                "Diseases": 1,
-            },
-            "Stroke": {
-                "Diseases": 1,
-            },
-            "Diabetes": {
-                "Diseases": 1,
-            },
-        }
-
-        self.all_topics = []
-        for nodes in self.topic_graph:
-            if nodes not in self.all_topics:
-                self.all_topics.append(nodes)
-            for node in self.topic_graph[nodes]:
-                if node not in self.all_topics:
-                    self.all_topics.append(node)
-        self.passages = []
-        for topic in self.all_topics:
-            with open(os.path.join(wikipedia_dir, topic), "r") as f:
-                self.passages.append(self.topic2description[topic] + f.read())
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.retriever_tokenizer = AutoTokenizer.from_pretrained(
-            retriever_path
-        )
-        self.retriever = AutoModelForSequenceClassification.from_pretrained(
-            retriever_path
-        ).to(device)
-        self.retriever.eval()
-
-        system_prompt = f"""In this role-play scenario, you'll take on the role of a Client discussing about your {self.behavior} where the Counselor's goal is {self.goal}.
-
-Here is your personas which you need to follow consistently throughout the conversation:
-[@personas]
-
-Here is a conversation occurs in parallel world between you (Client) and Counselor, where you can follow the style and information provided in the conversation:
-{reference}
+        self.knowledge_base = load_knowledge_base(wikipedia_dir)
+        self.topic_graph = self.knowledge_base.graph
+        self.all_topics = self.knowledge_base.topics
+        self.passages = self.knowledge_base.passages(self.behavior, self.goal)
+        passage_key = (self.behavior, self.goal, wikipedia_dir)
+        self.retriever = None
+        if retriever_path and (not embedder_path or rerank_top_k):
+            self.retriever = load_retriever(retriever_path, retriever_device)
+            self.passage_ids = self.retriever.encode_passages(
+                passage_key, self.passages
+            )
+        self.bm25 = None
+        self.bm25_candidates = bm25_candidates
+        self.measure_agreement = measure_agreement
+        self.retrieval_agreement = []
+        if bm25_candidates:
+            self.bm25 = load_bm25_index(passage_key, self.passages)
+        self.embedder = None
+        self.rerank_top_k = rerank_top_k
+        if embedder_path:
+            self.embedder = load_embedder(embedder_path, retriever_device)
+            self.passage_embeddings = None
+            if embedding_index:
+                self.passage_embeddings = load_passage_index(embedding_index).get(
+                    self.embedder, self.behavior, self.goal, self.all_topics
+                )
+            if self.passage_embeddings is None:
+                self.passage_embeddings = self.embedder.encode_passages(
+                    passage_key, self.passages
+                )
 
-Please follow these guidelines in your responses:
-- **Start your response with "Client: "**
-- **Adhere strictly to the state, action and persona specified within square brackets.**
-- **Keep your responses coherent and concise, similar to the reference conversation and no more than 3 sentences.**
-- **Be natural and concise without being overly polite.**
-- **Stick to the persona provided and avoid introducing contradictive details.**
-"""
-        personas = "- " + "\n- ".join(self.personas) + "\n-".join(self.beliefs)
-        system_prompt = system_prompt.replace("[@personas]", personas)
+        if system_prompt is None:
+            system_prompt = client_system_prompt(
+                self.behavior,
+                self.goal,
+                reference,
+                self.personas,
+                self.beliefs,
+                prompt_layout,
+            )
         self.messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": "Counselor: Hello. How are you?"},
             {"role": "assistant", "content": "Client: I am good. What about you?"},
         ]
         self.error_topic_count = 0
+        self.last_turn = {}
         self.model = model
+        self.concurrent_steps = concurrent_steps
+        self.speculative_information = speculative_information
+        if information_mode not in ("sequential", "batched"):
+            raise ValueError(f"Unknown information mode: {information_mode}")
+        self.information_mode = information_mode
+        self.fused_decision = fused_decision
+        self.history = history
+        # Each client draws from its own generators, so conversations sharing a process do not
+        # disturb each other's randomness and a resumed one continues exactly where it stopped.
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
 
-    def verify_motivation(self):
+    @timed("prompt")
+    def motivation_prompt(self):
         prompt = """Your task is to evaluate whether the Counselor's responses align with the Client's motivation concerning a specific topic, target (self or others), and aspect (risk or benefit). Determine if the Counselor's statements effectively motivates the Client. Your analysis should be logical, thorough, and well-supported, providing clear analysis at each step.
 
 Here are some examples to help you understand the task better:
@@ -678,111 +446,103 @@ Question: Can the Counselor's statement motivate the Client?
         prompt = prompt.replace("[@goal]", self.goal)
         prompt = prompt.replace("[@context]", "\n- ".join(self.context[-5:]))
         prompt = prompt.replace("[@motivation]", self.motivation)
-        response = get_precise_response(
-            messages=[{"role": "user", "content": prompt}], model=self.model
-        )
+        return prompt
+
+    def apply_motivation(self, response):
         if "yes" in response.lower():
             self.state = "Motivation"
         return response.split("\n")[0].split(": ")[-1]
 
+    @accounted("client", "verify_motivation")
+    def verify_motivation(self):
+        response = get_precise_response(
+            messages=[{"role": "user", "content": self.motivation_prompt()}],
+            model=self.model,
+        )
+        return self.apply_motivation(response)
+
+    def rerank(self, query, candidates):
+        scores = self.retriever.score(
+            query, [self.passage_ids[idx] for idx in candidates]
+        )
+        return [
+            candidates[i]
+            for i in sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        ]
+
+    @timed("retrieval")
+    def rank_topics(self, query):
+        if self.embedder is not None:
+            scores = self.embedder.score(query, self.passage_embeddings)
+            ranking = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+            if self.rerank_top_k and self.retriever is not None:
+                ranking = (
+                    self.rerank(query, ranking[: self.rerank_top_k])
+                    + ranking[self.rerank_top_k :]
+                )
+            return ranking
+        if self.bm25 is None:
+            return self.rerank(query, list(range(len(self.all_topics))))
+        # Only the BM25 candidates go through the cross-encoder, the rest keep their lexical order.
+        ranking = self.bm25.rank(query)
+        ranking = (
+            self.rerank(query, ranking[: self.bm25_candidates])
+            + ranking[self.bm25_candidates :]
+        )
+        if self.measure_agreement:
+            full_ranking = self.rerank(query, list(range(len(self.all_topics))))
+            self.retrieval_agreement.append(ranking[0] == full_ranking[0])
+        return ranking
+
     def top5_related_topics(self):
         query = self.context[-1].split("Counselor: ")[-1]
-        queries = [query] * len(self.all_topics)
-        query_evids = zip(queries, self.passages)
-        with torch.no_grad():
-            inputs = self.retriever_tokenizer(
-                list(query_evids),
-                padding=True,
-                truncation=True,
-                return_tensors="pt",
-                max_length=512,
-            )
-            inputs = {k: v.to(self.retriever.device) for k, v in inputs.items()}
-            batch_scores = (
-                self.retriever(**inputs, return_dict=True)
-                .logits.view(
-                    -1,
-                )
-                .float()
-            )
-            scores_sigmoid = torch.sigmoid(batch_scores)
-            scores = scores_sigmoid.tolist()
-        top_5_indices = sorted(
-            range(len(scores)), key=lambda i: scores[i], reverse=True
-        )[:5]
+        top_5_indices = self.rank_topics(query)[:5]
         top5_topics = [self.all_topics[idx] for idx in top_5_indices]
         return top5_topics
 
-    def dijkstra(self, graph, start_node, target_node):
-        # Initialize distances dictionary with infinity for all nodes
-        distances = {node: float("infinity") for node in graph}
-        distances[start_node] = 0
-
-        # Priority queue to store (distance, node)
-        pq = [(0, start_node)]
-
-        # Keep track of visited nodes
-        visited = set()
-
-        while pq:
-            # Get node with minimum distance
-            current_distance, current_node = heapq.heappop(pq)
-
-            # If we reached target node, return the distance
-            if current_node == target_node:
-                return current_distance
-
-            # Skip if we've already visited this node
-            if current_node in visited:
-                continue
-
-            visited.add(current_node)
-
-            # Check all neighbors
-            for neighbor, weight in graph[current_node].items():
-                if neighbor not in visited:
-                    distance = current_distance + weight
-
-                    # If we found a shorter path, update it
-                    if distance < distances[neighbor]:
-                        distances[neighbor] = distance
-                        heapq.heappush(pq, (distance, neighbor))
-
-        # If no path found
-        return float("infinity")
+    def update_engagement(self, predicted_topic):
+        if predicted_topic == self.engagemented_topics[0]:
+            self.engagement = 4
+            self.error_topic_count = 0
+            return None
+        distance = self.knowledge_base.distance(
+            self.engagemented_topics[0], predicted_topic
+        )
+        if distance <= 3:
+            self.engagement = 3
+            self.error_topic_count = 0
+            return f"The client's perceived topic is {predicted_topic}."
+        if distance <= 5:
+            self.engagement = 2
+            return f"The client's perceived topic is {predicted_topic}."
+        else:
+            self.engagement = 1
+            if len(self.context) > 10:
+                self.error_topic_count += 1
+            return f"The client's perceived topic is {predicted_topic}."
 
-    def update_state(self):
+    def advance_state(self):
+        # Returns the engagement analysis and whether the motivation still has to be verified.
         if self.state == "Contemplation":
             if len(self.beliefs) == 0:
                 self.state = "Preparation"
-            return
+            return None, False
         elif self.state == "Preparation":
-            return
+            return None, False
         else:
             top_topics = self.top5_related_topics()
             predicted_topic = top_topics[0]
-            if predicted_topic == self.engagemented_topics[0]:
-                self.engagement = 4
-                self.error_topic_count = 0
-                motivation_analysis = self.verify_motivation()
-                return motivation_analysis
-            distance = self.dijkstra(
-                self.topic_graph, self.engagemented_topics[0], predicted_topic
-            )
-            if distance <= 3:
-                self.engagement = 3
-                self.error_topic_count = 0
-                return f"The client's perceived topic is {predicted_topic}."
-            if distance <= 5:
-                self.engagement = 2
-                return f"The client's perceived topic is {predicted_topic}."
-            else:
-                self.engagement = 1
-                if len(self.context) > 10:
-                    self.error_topic_count += 1
-                return f"The client's perceived topic is {predicted_topic}."
+            engagement_analysis = self.update_engagement(predicted_topic)
+            return engagement_analysis, engagement_analysis is None
 
-    def select_action(self):
+    def update_state(self):
+        engagement_analysis, verify = self.advance_state()
+        if verify:
+            return self.verify_motivation()
+        return engagement_analysis
+
+    @timed("prompt")
+    def action_prompt(self):
         prompt = """Assume you are a Client involved in a counseling conversation. The current conversation is provided below:
 [@context]
 
@@ -801,28 +561,35 @@ Provide your response in JSON format, ensuring that the sum of all probabilities
             .replace("Client:", "**Client**:")
             .replace("Counselor:", "**Counselor**:"),
         )
+        return prompt
+
+    def parse_action_distribution(self, response):
+        response = response.replace("```", "").replace("json", "")
+        try:
+            return eval(response)
+        except SyntaxError:
+            return None
+
+    @accounted("client", "select_action")
+    def request_action_distribution(self):
+        prompt = self.action_prompt()
         context_aware_action_distribution = None
         for _ in range(5):
             response = get_json_response(
-                messages=[{"role": "user", "content": prompt}], model=self.model
+                messages=[{"role": "user", "content": prompt}],
+                model=self.model,
+                accept=self.parse_action_distribution,
+            )
+            context_aware_action_distribution = self.parse_action_distribution(
+                response
             )
-            response = response.replace("```", "").replace("json", "")
-            try:
-                context_aware_action_distribution = eval(response)
-            except SyntaxError:
-                continue
             if context_aware_action_distribution:
                 break
-        if not context_aware_action_distribution:
-            context_aware_action_distribution = {
-                "Deny": 20,
-                "Downplay": 20,
-                "Blame": 20,
-                "Engage": 20,
-                "Inform": 20,
-            }
+        return context_aware_action_distribution
+
+    def receptivity_action_distribution(self):
         if self.receptivity < 2:
-            receptivity_aware_action_distribution = {
+            return {
                 "Deny": 23,
                 "Downplay": 28,
                 "Blame": 15,
@@ -830,7 +597,7 @@ Provide your response in JSON format, ensuring that the sum of all probabilities
                 "Inform": 22,
             }
         elif self.receptivity < 3:
-            receptivity_aware_action_distribution = {
+            return {
                 "Deny": 20,
                 "Downplay": 25,
                 "Blame": 10,
@@ -838,7 +605,7 @@ Provide your response in JSON format, ensuring that the sum of all probabilities
                 "Inform": 30,
             }
         elif self.receptivity < 4:
-            receptivity_aware_action_distribution = {
+            return {
                 "Deny": 19,
                 "Downplay": 21,
                 "Blame": 11,
@@ -846,7 +613,7 @@ Provide your response in JSON format, ensuring that the sum of all probabilities
                 "Inform": 36,
             }
         elif self.receptivity < 5:
-            receptivity_aware_action_distribution = {
+            return {
                 "Deny": 9,
                 "Downplay": 20,
                 "Blame": 13,
@@ -854,13 +621,24 @@ Provide your response in JSON format, ensuring that the sum of all probabilities
                 "Inform": 44,
             }
         else:
-            receptivity_aware_action_distribution = {
+            return {
                 "Deny": 7,
                 "Downplay": 13,
                 "Blame": 4,
                 "Engage": 16,
                 "Inform": 60,
             }
+
+    def sample_action(self, context_aware_action_distribution):
+        if not context_aware_action_distribution:
+            context_aware_action_distribution = {
+                "Deny": 20,
+                "Downplay": 20,
+                "Blame": 20,
+                "Engage": 20,
+                "Inform": 20,
+            }
+        receptivity_aware_action_distribution = self.receptivity_action_distribution()
         action_distribution = {
             action: context_aware_action_distribution.get(action, 0)
             + receptivity_aware_action_distribution[action]
@@ -875,55 +653,130 @@ Provide your response in JSON format, ensuring that the sum of all probabilities
             k: v / sum(action_distribution.values())
             for k, v in action_distribution.items()
         }
-        sampled_action = np.random.choice(
+        sampled_action = self.np_rng.choice(
             list(action_distribution.keys()),
             size=1,
             p=list(action_distribution.values()),
         )[0]
         return sampled_action
 
-    def select_information(self, action):
-        messages = []
-        if "?" not in self.context[-1]:
-            return None
+    def select_action(self):
+        return self.sample_action(self.request_action_distribution())
+
+    @timed("prompt")
+    def information_messages(self):
         prompt = """Here is a conversation between Client and Counselor:
 [@conv]
 
 Is there a question in the last utterance of Counselor? Yes or No"""
         prompt = prompt.replace("[@conv]", "\n".join(self.context[-3:]))
         response = "Yes, there is a question in the last utterance of Counselor."
-        messages.append({"role": "user", "content": prompt})
-        messages.append({"role": "assistant", "content": response})
-        if action == "Inform":
-            prompt2 = """Can the following Client's persona answer the question? Yes or No
-[@persona]"""
-            personas = self.personas
-        elif action == "Downplay":
-            prompt2 = """Can the following Client's persona reply the question to downplay the importance or impact of behavior? Yes or No
-[@persona]"""
-            personas = self.beliefs
-        elif action == "Blame":
-            prompt2 = """Can the following Client's persona reply the question to blame external factors or others to justify? Yes or No
-[@persona]"""
-            personas = self.beliefs
-        elif action == "Hesitate":
-            prompt2 = """Can the following Client's persona reply the question to show uncertainty, indicating ambivalence about change? Yes or No
+        return [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": response},
+        ]
+
+    def information_candidates(self, action):
+        criterion = self.information_criteria[action]
+        prompt2 = f"""Can the following Client's persona {criterion}? Yes or No
 [@persona]"""
-            personas = self.beliefs
+        personas = self.personas if action == "Inform" else self.beliefs
+        return prompt2, personas
+
+    @timed("prompt")
+    def batched_information_prompt(self, action, personas):
+        prompt = """Here are the Client's personas:
+[@personas]
+
+Which of these personas can [@criterion]? Choose the one that fits best.
+
+Provide your response in JSON format with a short reason and the number of the chosen persona, or 0 if none of them fits. For example: {"reason": "The persona describes ...", "persona": 2}"""
+        prompt = prompt.replace(
+            "[@personas]",
+            "\n".join(f"{i}. {persona}" for i, persona in enumerate(personas, 1)),
+        )
+        prompt = prompt.replace("[@criterion]", self.information_criteria[action])
+        return prompt
+
+    def information_index(self, index, personas):
+        if isinstance(index, str) and index.strip().isdigit():
+            index = int(index)
+        if isinstance(index, bool) or not isinstance(index, int):
+            return None
+        if not 0 <= index <= len(personas):
+            return None
+        return index
+
+    def parse_information_choice(self, response, personas):
+        # Returns (persona or None, reason), or None when the answer is unusable.
+        response = response.replace("```", "").replace("json", "")
+        try:
+            choice = json.loads(response)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(choice, dict):
+            return None
+        index = self.information_index(choice.get("persona"), personas)
+        if index is None:
+            return None
+        reason = choice.get("reason")
+        if not isinstance(reason, str) or not reason:
+            reason = "No" if index == 0 else "Yes"
+        if index == 0:
+            return None, reason
+        return personas[index - 1], reason
+
+    def use_information(self, action, personas, persona):
+        if action == "Hesitate":
+            personas.pop(personas.index(persona))
+        return persona
+
+    @accounted("client", "select_information")
+    def match_information(self, action):
+        # Only the LLM part of information selection: no randomness is drawn and no belief is
+        # consumed, so it is safe to run speculatively for actions that may not be sampled.
+        if "?" not in self.context[-1]:
+            return None
+        messages = self.information_messages()
+        response = messages[-1]["content"]
+        prompt2, personas = self.information_candidates(action)
+        if self.information_mode == "batched" and personas:
+            # One JSON call judges every candidate; fall back to asking one by one if the
+            # answer cannot be used.
+            prompt = self.batched_information_prompt(action, personas)
+            match = self.parse_information_choice(
+                get_json_response(
+                    messages=messages + [{"role": "user", "content": prompt}],
+                    model=self.model,
+                    accept=lambda response: self.parse_information_choice(response, personas)
+                    is not None,
+                ),
+                personas,
+            )
+            if match is not None:
+                return match
         for persona in personas:
             prompt = prompt2.replace("[@persona]", persona)
             messages.append({"role": "user", "content": prompt})
             response = get_precise_response(messages=messages, model=self.model)
             messages.append({"role": "assistant", "content": response})
             if "yes" in response.lower():
-                if action == "Hesitate":
-                    personas.pop(personas.index(persona))
-                return persona
-        persona = random.choice(personas)
-        if action == "Hesitate":
-            personas.pop(personas.index(persona))
+                return persona, response
+        return None, response
+
+    def resolve_information(self, action, match):
+        if match is None:
+            return None
+        persona, response = match
+        _, personas = self.information_candidates(action)
+        if persona is not None:
+            return self.use_information(action, personas, persona)
+        self.use_information(action, personas, self.rng.choice(personas))
         return response
 
+    def select_information(self, action):
+        return self.resolve_information(action, self.match_information(action))
+
     def receive(self, response):
         self.context.append(response)
 
@@ -937,59 +790,55 @@ Is there a question in the last utterance of Counselor? Yes or No"""
         elif self.engagement == 4:
             return f"Offer specific responses that affirm the counselor is on the right track, showing that you're motivated by {self.engagemented_topics[0]}. {self.motivation}"
 
-    def reply(self):
-        engagement_analysis = self.update_state()
-        information = None
-        if self.state == "Motivation":
+    def fixed_action(self, state):
+        if state == "Motivation":
+            return "Acknowledge"
+        if state == "Precontemplation" and self.error_topic_count >= 5:
+            return "Terminate"
+        if state == "Preparation" and len(self.acceptable_plans) == 0:
+            return "Terminate"
+        return None
+
+    def gather_information(self, state, action):
+        if action in self.information_actions.get(state, ()):
+            return self.select_information(action)
+        if state == "Preparation" and action == "Plan":
+            return self.acceptable_plans.pop(0)
+        return None
+
+    @timed("prompt")
+    def build_instruction(self, state, action, information, engagement_analysis):
+        if state == "Motivation":
             engage_instruction = f"Offer specific responses that affirm the counselor is on the right track, showing that you're motivated by {self.engagemented_topics[0]}."
             instruction = f"[{self.motivation} {self.action2prompt['Acknowledge']} {engage_instruction}]"
             output_instruction = f"[Engagement: {engage_instruction} || Motivation: {self.motivation} || Action: {self.action2prompt['Acknowledge']}]"
-            self.state = "Contemplation"
-            action = "Acknowledge"
-        elif self.state == "Precontemplation":
+        elif state == "Precontemplation":
             engage_instruction = self.get_engage_instruction()
-            if self.error_topic_count >= 5:
-                action = "Terminate"
-            else:
-                action = self.select_action()
             if action == "Inform" or action == "Downplay" or action == "Blame":
-                information = self.select_information(action)
-                instruction = f"[{engage_instruction} {self.state2prompt[self.state]} {self.action2prompt[action]} You should follow the persona: {information} Don't show overknowledge and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
-                output_instruction = f"[Engage Instruction: {engagement_analysis} {engage_instruction} || State Instruction: {self.state2prompt[self.state]} || Information: {information} || Action Instruction: {self.action2prompt[action]}]"
+                instruction = f"[{engage_instruction} {self.state2prompt[state]} {self.action2prompt[action]} You should follow the persona: {information} Don't show overknowledge and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
+                output_instruction = f"[Engage Instruction: {engagement_analysis} {engage_instruction} || State Instruction: {self.state2prompt[state]} || Information: {information} || Action Instruction: {self.action2prompt[action]}]"
             else:
-                instruction = f"[{engage_instruction} {self.state2prompt[self.state]} {self.action2prompt[action]} Don't show overknowledge and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
-                output_instruction = f"[Engage Instruction: {engagement_analysis} {engage_instruction} || State Instruction: {self.state2prompt[self.state]} || Action Instruction: {self.action2prompt[action]}]"
-        elif self.state == "Contemplation":
-            action = self.select_action()
+                instruction = f"[{engage_instruction} {self.state2prompt[state]} {self.action2prompt[action]} Don't show overknowledge and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
+                output_instruction = f"[Engage Instruction: {engagement_analysis} {engage_instruction} || State Instruction: {self.state2prompt[state]} || Action Instruction: {self.action2prompt[action]}]"
+        elif state == "Contemplation":
             if action == "Hesitate" or action == "Inform":
-                information = self.select_information(action)
-                instruction = f"[{self.state2prompt[self.state]} {self.action2prompt[action]} You should follow the persona: {information} Don't show overknowledge and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
-                output_instruction = f"[State Instruction: {self.state2prompt[self.state]} || Information: {information} || Action Instruction: {self.action2prompt[action]}]"
+                instruction = f"[{self.state2prompt[state]} {self.action2prompt[action]} You should follow the persona: {information} Don't show overknowledge and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
+                output_instruction = f"[State Instruction: {self.state2prompt[state]} || Information: {information} || Action Instruction: {self.action2prompt[action]}]"
             else:
-                instruction = f"[{self.state2prompt[self.state]} {self.action2prompt[action]} Don't show overknowledge and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
-                output_instruction = f"[State Instruction: {self.state2prompt[self.state]} || Action Instruction: {self.action2prompt[action]}]"
+                instruction = f"[{self.state2prompt[state]} {self.action2prompt[action]} Don't show overknowledge and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
+                output_instruction = f"[State Instruction: {self.state2prompt[state]} || Action Instruction: {self.action2prompt[action]}]"
         else:
-            if len(self.acceptable_plans) == 0:
-                action = "Terminate"
-            else:
-                action = self.select_action()
-            if action == "Inform":
-                information = self.select_information(action)
-                instruction = f"[{self.state2prompt[self.state]} {self.action2prompt[action]} You should follow the persona: {information} Don't show overknowledge and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
-                output_instruction = f"[State Instruction: {self.state2prompt[self.state]} || Information: {information} || Action Instruction: {self.action2prompt[action]}]"
             if action == "Plan":
-                information = self.acceptable_plans.pop(0)
-                instruction = f"[{self.state2prompt[self.state]} {information} {self.action2prompt[action]} Don't show overknowledge, and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
-                output_instruction = f"State Instruction: {self.state2prompt[self.state]} || Information: {information} || Action Instruction: {self.action2prompt[action]}]"
+                instruction = f"[{self.state2prompt[state]} {information} {self.action2prompt[action]} Don't show overknowledge, and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
+                output_instruction = f"State Instruction: {self.state2prompt[state]} || Information: {information} || Action Instruction: {self.action2prompt[action]}]"
             else:
-                instruction = f"[{self.state2prompt[self.state]} {self.action2prompt[action]} Don't show overknowledge, and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
-                output_instruction = f"[State Instruction: {self.state2prompt[self.state]} || Action Instruction: {self.action2prompt[action]}]"
+                instruction = f"[{self.state2prompt[state]} {self.action2prompt[action]} Don't show overknowledge, and keep your responses concise (no more than 50 words). Don't highlight your state explicitly.]"
+                output_instruction = f"[State Instruction: {self.state2prompt[state]} || Action Instruction: {self.action2prompt[action]}]"
         instruction = instruction.replace("\n", " ")
         output_instruction = output_instruction.replace("\n", " ")
-        self.messages.append(
-            {"role": "user", "content": f"{self.context[-1]} {instruction}"}
-        )
-        response = get_chatbot_response(self.messages, model=self.model)
+        return instruction, output_instruction
+
+    def finish_reply(self, response, output_instruction):
         if not response.startswith("Client: "):
             response = f"Client: {response}"
         response = response.replace("\n", " ").strip().lstrip()
@@ -1000,3 +849,500 @@ Is there a question in the last utterance of Counselor? Yes or No"""
         self.context.append(response)
         self.messages.append({"role": "assistant", "content": response})
         return f"{output_instruction} {response}"
+
+    def enter_state(self):
+        state = self.state
+        if state == "Motivation":
+            self.state = "Contemplation"
+        return state
+
+    def speculative_actions(self):
+        if not self.speculative_information or "?" not in self.context[-1]:
+            return []
+        prior = self.receptivity_action_distribution()
+        actions = [
+            action
+            for action in self.information_actions.get(self.state, ())
+            if prior.get(action, 0) > 0
+        ]
+        actions.sort(key=lambda action: prior[action], reverse=True)
+        return actions[: self.speculative_information]
+
+    @timed("prompt")
+    def decision_prompt(self, state, verify, select):
+        prompt = """Assume you are a Client discussing your [@behavior] with a Counselor whose goal is [@goal]. The current conversation is provided below:
+[@context]
+
+Answer the following questions about the last utterance of Counselor in one JSON object.
+[@tasks]
+
+Provide your response in JSON format. For example: [@example]"""
+        tasks = []
+        example = {}
+        if verify:
+            tasks.append(
+                f"""- "motivation": Can the Counselor's statement motivate the Client? It should address the Client's specific topic, target (self or others) and aspect (risk or benefit). Give a short analysis and true or false.
+  The Motivation of Client is: {self.motivation}"""
+            )
+            example["motivation"] = {
+                "analysis": "The Counselor's statement does not address ...",
+                "motivated": False,
+            }
+        if select:
+            tasks.append(
+                """- "actions": Allocate probabilities, summing to 100, to each of the following dialogue actions to maintain coherence:
+  - Deny: The client should directly refuse to admit their behavior is problematic or needs change without additional reasons.
+  - Downplay: The client should downplay the importance or impact of their behavior or situation.
+  - Blame: The client should blame external factors or others to justify their behavior.
+  - Inform: The client should share details about their background, experiences, or emotions.
+  - Engage: The client interacts politely with the counselor, such as greeting or thanking."""
+            )
+            example["actions"] = {
+                "Deny": 35,
+                "Downplay": 25,
+                "Blame": 25,
+                "Inform": 5,
+                "Engage": 10,
+            }
+            tasks.append(
+                """- "question": Is there a question in the last utterance of Counselor? true or false"""
+            )
+            example["question"] = True
+            choices = []
+            for action in self.information_actions.get(state, ()):
+                _, personas = self.information_candidates(action)
+                if not personas:
+                    continue
+                listing = "\n".join(
+                    f"    {i}. {persona}" for i, persona in enumerate(personas, 1)
+                )
+                choices.append(
+                    f"  - {action}: Which of the following Client's personas can {self.information_criteria[action]}?\n{listing}"
+                )
+                example.setdefault("information", {})[action] = 1
+            if choices:
+                tasks.append(
+                    '- "information": For each of the following, give the number of the persona that fits best, or 0 if none of them fits.\n'
+                    + "\n".join(choices)
+                )
+        prompt = prompt.replace("[@behavior]", self.behavior)
+        prompt = prompt.replace("[@goal]", self.goal)
+        prompt = prompt.replace("[@context]", "\n".join(self.context[-5:]))
+        prompt = prompt.replace("[@tasks]", "\n".join(tasks))
+        prompt = prompt.replace("[@example]", json.dumps(example))
+        return prompt
+
+    def parse_decision(self, response, state, verify):
+        # Keeps only the fields that validate; the caller asks separately for the rest.
+        response = response.replace("```", "").replace("json", "")
+        try:
+            decision = json.loads(response)
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(decision, dict):
+            return {}
+        parsed = {}
+        motivation = decision.get("motivation")
+        if (
+            verify
+            and isinstance(motivation, dict)
+            and isinstance(motivation.get("motivated"), bool)
+        ):
+            analysis = motivation.get("analysis")
+            if not isinstance(analysis, str) or not analysis:
+                analysis = "Yes" if motivation["motivated"] else "No"
+            parsed["motivation"] = (analysis.replace("\n", " "), motivation["motivated"])
+        actions = decision.get("actions")
+        if isinstance(actions, dict):
+            distribution = {
+                action: probability
+                for action, probability in actions.items()
+                if action in ("Deny", "Downplay", "Blame", "Inform", "Engage")
+                and isinstance(probability, (int, float))
+                and not isinstance(probability, bool)
+                and probability >= 0
+            }
+            if sum(distribution.values()) > 0:
+                parsed["actions"] = distribution
+        if isinstance(decision.get("question"), bool):
+            parsed["question"] = decision["question"]
+        information = decision.get("information")
+        if isinstance(information, dict):
+            parsed["information"] = {}
+            for action in self.information_actions.get(state, ()):
+                _, personas = self.information_candidates(action)
+                index = self.information_index(information.get(action), personas)
+                if index:
+                    parsed["information"][action] = (personas[index - 1], "Yes")
+                elif index == 0:
+                    parsed["information"][action] = (None, "No")
+        return parsed
+
+    def decision_complete(self, decision, verify, select):
+        # Only complete decisions are cached; a partial one is completed by separate calls.
+        required = (["motivation"] if verify else []) + (["actions", "question"] if select else [])
+        return all(field in decision for field in required)
+
+    @accounted("client", "fused_decision")
+    def request_decision(self, state, verify, select):
+        response = get_json_response(
+            messages=[
+                {"role": "user", "content": self.decision_prompt(state, verify, select)}
+            ],
+            model=self.model,
+            accept=lambda response: self.decision_complete(
+                self.parse_decision(response, state, verify), verify, select
+            ),
+        )
+        return self.parse_decision(response, state, verify)
+
+    def apply_decision(self, decision):
+        analysis, motivated = decision["motivation"]
+        if motivated:
+            self.state = "Motivation"
+        return analysis
+
+    def decided_information(self, decision, action):
+        # Returns False when the decision cannot answer for this action.
+        if decision.get("question") is False:
+            return None
+        if decision.get("question") and action in decision.get("information", {}):
+            return decision["information"][action]
+        return False
+
+    def fused_reply(self):
+        # Motivation, action distribution, question check and persona matching share one
+        # JSON request; any field that fails validation falls back to its own call.
+        engagement_analysis, verify = self.advance_state()
+        select = self.fixed_action(self.state) is None
+        decision = {}
+        if verify or select:
+            decision = self.request_decision(self.state, verify, select)
+        if verify:
+            if "motivation" in decision:
+                engagement_analysis = self.apply_decision(decision)
+            else:
+                engagement_analysis = self.verify_motivation()
+        state = self.enter_state()
+        action = self.fixed_action(state)
+        if action is None:
+            distribution = decision.get("actions")
+            if distribution is None:
+                distribution = self.request_action_distribution()
+            action = self.sample_action(distribution)
+        if action in self.information_actions.get(state, ()):
+            match = self.decided_information(decision, action)
+            if match is False:
+                match = self.match_information(action)
+            information = self.resolve_information(action, match)
+        else:
+            information = self.gather_information(state, action)
+        return self.respond(state, action, information, engagement_analysis)
+
+    def turn_record(self, state, action, information, engagement_analysis, output_instruction):
+        return {
+            "state": state,
+            "action": action,
+            "engagement": self.engagement,
+            "engagement_analysis": engagement_analysis,
+            "information": information,
+            "instruction": output_instruction,
+        }
+
+    @accounted("client", "reply")
+    def respond(self, state, action, information, engagement_analysis):
+        instruction, output_instruction = self.build_instruction(
+            state, action, information, engagement_analysis
+        )
+        self.last_turn = self.turn_record(
+            state, action, information, engagement_analysis, output_instruction
+        )
+        self.messages.append(
+            {"role": "user", "content": f"{self.context[-1]} {instruction}"}
+        )
+        response = get_chatbot_response(self.prompt_messages(), model=self.model)
+        return self.finish_reply(response, output_instruction)
+
+    @timed("prompt")
+    @accounted("client", "history_summary")
+    def prompt_messages(self):
+        if self.history is None:
+            return self.messages
+        return self.history.prepare(
+            self.messages, lambda prompt: get_precise_response(prompt, model=self.model)
+        )
+
+    def concurrent_reply(self):
+        # The action distribution and the persona matching for the likely actions do not depend
+        # on retrieval, so they are requested while update_state runs. Sampling still happens in
+        # the original order, so the turn consumes randomness exactly like reply().
+        executor = get_step_executor()
+        distribution = executor.submit(
+            contextvars.copy_context().run, self.request_action_distribution
+        )
+        matches = {
+            action: executor.submit(
+                contextvars.copy_context().run, self.match_information, action
+            )
+            for action in self.speculative_actions()
+        }
+        engagement_analysis = self.update_state()
+        state = self.enter_state()
+        action = self.fixed_action(state)
+        if action is None:
+            action = self.sample_action(distribution.result())
+        else:
+            distribution.cancel()
+        if action in matches and action in self.information_actions.get(state, ()):
+            information = self.resolve_information(action, matches.pop(action).result())
+        else:
+            information = self.gather_information(state, action)
+        for match in matches.values():
+            match.cancel()
+        return self.respond(state, action, information, engagement_analysis)
+
+    def reply(self):
+        if self.fused_decision:
+            return self.fused_reply()
+        if self.concurrent_steps:
+            return self.concurrent_reply()
+        engagement_analysis = self.update_state()
+        state = self.enter_state()
+        action = self.fixed_action(state)
+        if action is None:
+            action = self.select_action()
+        information = self.gather_information(state, action)
+        return self.respond(state, action, information, engagement_analysis)
+
+    def state_dict(self):
+        # Everything a conversation changes, so it can be resumed from a checkpoint.
+        return {
+            "messages": [dict(message) for message in self.messages],
+            "context": list(self.context),
+            "state": self.state,
+            "engagement": self.engagement,
+            "personas": list(self.personas),
+            "beliefs": list(self.beliefs),
+            "acceptable_plans": list(self.acceptable_plans),
+            "error_topic_count": self.error_topic_count,
+            "last_turn": dict(self.last_turn),
+            "retrieval_agreement": list(self.retrieval_agreement),
+            "history": self.history.state_dict() if self.history else None,
+            "random_state": self.rng.getstate(),
+            "numpy_random_state": self.np_rng.bit_generator.state,
+        }
+
+    def load_state_dict(self, state):
+        self.messages = [dict(message) for message in state["messages"]]
+        self.context = list(state["context"])
+        self.state = state["state"]
+        self.engagement = state["engagement"]
+        self.personas = list(state["personas"])
+        self.beliefs = list(state["beliefs"])
+        self.acceptable_plans = list(state["acceptable_plans"])
+        self.error_topic_count = state["error_topic_count"]
+        self.last_turn = dict(state["last_turn"])
+        self.retrieval_agreement = list(state["retrieval_agreement"])
+        if self.history is not None and state["history"] is not None:
+            self.history.load_state_dict(state["history"])
+        self.rng.setstate(state["random_state"])
+        self.np_rng.bit_generator.state = state["numpy_random_state"]
+
+
+class AsyncClient(Client):
+    def __init__(self, *args, executor=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Retrieval is CPU-bound, so it runs in an executor instead of the event loop.
+        self.executor = executor
+
+    @accounted("client", "verify_motivation")
+    async def verify_motivation(self):
+        response = await aget_precise_response(
+            messages=[{"role": "user", "content": self.motivation_prompt()}],
+            model=self.model,
+        )
+        return self.apply_motivation(response)
+
+    async def top5_related_topics(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, contextvars.copy_context().run, super().top5_related_topics
+        )
+
+    async def advance_state(self):
+        if self.state == "Contemplation":
+            if len(self.beliefs) == 0:
+                self.state = "Preparation"
+            return None, False
+        elif self.state == "Preparation":
+            return None, False
+        else:
+            top_topics = await self.top5_related_topics()
+            predicted_topic = top_topics[0]
+            engagement_analysis = self.update_engagement(predicted_topic)
+            return engagement_analysis, engagement_analysis is None
+
+    async def update_state(self):
+        engagement_analysis, verify = await self.advance_state()
+        if verify:
+            return await self.verify_motivation()
+        return engagement_analysis
+
+    @accounted("client", "select_action")
+    async def request_action_distribution(self):
+        prompt = self.action_prompt()
+        context_aware_action_distribution = None
+        for _ in range(5):
+            response = await aget_json_response(
+                messages=[{"role": "user", "content": prompt}],
+                model=self.model,
+                accept=self.parse_action_distribution,
+            )
+            context_aware_action_distribution = self.parse_action_distribution(
+                response
+            )
+            if context_aware_action_distribution:
+                break
+        return context_aware_action_distribution
+
+    async def select_action(self):
+        return self.sample_action(await self.request_action_distribution())
+
+    @accounted("client", "select_information")
+    async def match_information(self, action):
+        if "?" not in self.context[-1]:
+            return None
+        messages = self.information_messages()
+        response = messages[-1]["content"]
+        prompt2, personas = self.information_candidates(action)
+        if self.information_mode == "batched" and personas:
+            prompt = self.batched_information_prompt(action, personas)
+            match = self.parse_information_choice(
+                await aget_json_response(
+                    messages=messages + [{"role": "user", "content": prompt}],
+                    model=self.model,
+                    accept=lambda response: self.parse_information_choice(response, personas)
+                    is not None,
+                ),
+                personas,
+            )
+            if match is not None:
+                return match
+        for persona in personas:
+            prompt = prompt2.replace("[@persona]", persona)
+            messages.append({"role": "user", "content": prompt})
+            response = await aget_precise_response(messages=messages, model=self.model)
+            messages.append({"role": "assistant", "content": response})
+            if "yes" in response.lower():
+                return persona, response
+        return None, response
+
+    async def select_information(self, action):
+        return self.resolve_information(action, await self.match_information(action))
+
+    async def gather_information(self, state, action):
+        if action in self.information_actions.get(state, ()):
+            return await self.select_information(action)
+        if state == "Preparation" and action == "Plan":
+            return self.acceptable_plans.pop(0)
+        return None
+
+    @accounted("client", "reply")
+    async def respond(self, state, action, information, engagement_analysis):
+        instruction, output_instruction = self.build_instruction(
+            state, action, information, engagement_analysis
+        )
+        self.last_turn = self.turn_record(
+            state, action, information, engagement_analysis, output_instruction
+        )
+        self.messages.append(
+            {"role": "user", "content": f"{self.context[-1]} {instruction}"}
+        )
+        response = await aget_chatbot_response(
+            await self.prompt_messages(), model=self.model
+        )
+        return self.finish_reply(response, output_instruction)
+
+    @timed("prompt")
+    @accounted("client", "history_summary")
+    async def prompt_messages(self):
+        if self.history is None:
+            return self.messages
+        return await self.history.aprepare(
+            self.messages, lambda prompt: aget_precise_response(prompt, model=self.model)
+        )
+
+    @accounted("client", "fused_decision")
+    async def request_decision(self, state, verify, select):
+        response = await aget_json_response(
+            messages=[
+                {"role": "user", "content": self.decision_prompt(state, verify, select)}
+            ],
+            model=self.model,
+            accept=lambda response: self.decision_complete(
+                self.parse_decision(response, state, verify), verify, select
+            ),
+        )
+        return self.parse_decision(response, state, verify)
+
+    async def fused_reply(self):
+        engagement_analysis, verify = await self.advance_state()
+        select = self.fixed_action(self.state) is None
+        decision = {}
+        if verify or select:
+            decision = await self.request_decision(self.state, verify, select)
+        if verify:
+            if "motivation" in decision:
+                engagement_analysis = self.apply_decision(decision)
+            else:
+                engagement_analysis = await self.verify_motivation()
+        state = self.enter_state()
+        action = self.fixed_action(state)
+        if action is None:
+            distribution = decision.get("actions")
+            if distribution is None:
+                distribution = await self.request_action_distribution()
+            action = self.sample_action(distribution)
+        if action in self.information_actions.get(state, ()):
+            match = self.decided_information(decision, action)
+            if match is False:
+                match = await self.match_information(action)
+            information = self.resolve_information(action, match)
+        else:
+            information = await self.gather_information(state, action)
+        return await self.respond(state, action, information, engagement_analysis)
+
+    async def concurrent_reply(self):
+        distribution = asyncio.ensure_future(self.request_action_distribution())
+        matches = {
+            action: asyncio.ensure_future(self.match_information(action))
+            for action in self.speculative_actions()
+        }
+        try:
+            engagement_analysis = await self.update_state()
+            state = self.enter_state()
+            action = self.fixed_action(state)
+            if action is None:
+                action = self.sample_action(await distribution)
+            if action in matches and action in self.information_actions.get(state, ()):
+                information = self.resolve_information(action, await matches.pop(action))
+            else:
+                information = await self.gather_information(state, action)
+        finally:
+            distribution.cancel()
+            for match in matches.values():
+                match.cancel()
+        return await self.respond(state, action, information, engagement_analysis)
+
+    async def reply(self):
+        if self.fused_decision:
+            return await self.fused_reply()
+        if self.concurrent_steps:
+            return await self.concurrent_reply()
+        engagement_analysis = await self.update_state()
+        state = self.enter_state()
+        action = self.fixed_action(state)
+        if action is None:
+            action = await self.select_action()
+        information = await self.gather_information(state, action)
+        return await self.respond(state, action, information, engagement_analysis)
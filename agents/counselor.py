@@ -1,14 +1,18 @@
 import backoff
 import openai
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import os
 from openai.types.chat.completion_create_params import ResponseFormatJSONObject
+from .accounting import accounted
+from .llm import acreate_chat_completion, create_chat_completion
+from .profiling import timed
 
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 
 openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
 
 @backoff.on_exception(
@@ -25,7 +29,8 @@ openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 def get_chatbot_response(
     messages, model="gpt-3.5-turbo-0125", temperature=0.7, top_p=0.8, max_tokens=150
 ):
-    message = openai_client.chat.completions.create(
+    message = create_chat_completion(
+        openai_client,
         model=model,
         messages=messages,
         temperature=temperature,
@@ -49,7 +54,8 @@ def get_chatbot_response(
 def get_precise_response(
     messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1, max_tokens=150
 ):
-    message = openai_client.chat.completions.create(
+    message = create_chat_completion(
+        openai_client,
         model=model,
         messages=messages,
         temperature=temperature,
@@ -74,7 +80,8 @@ def get_json_response(
     messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1, max_tokens=150
 ):
     format = ResponseFormatJSONObject()
-    message = openai_client.chat.completions.create(
+    message = create_chat_completion(
+        openai_client,
         model=model,
         messages=messages,
         temperature=temperature,
@@ -85,12 +92,62 @@ def get_json_response(
     return message.choices[0].message.content
 
 
-class Counselor:
-    def __init__(self, goal, behavior, model):
-        system_prompt = f"""## Instruction
-You will act as a skilled counselor conducting a Motivational Interviewing (MI) session aimed at achieving {goal} related to the client's behavior, {behavior}. Your task is to help the client discover their inherent motivation to change and identify a tangible plan to change. Start the conversation with the client with some initial rapport building, such as asking, How are you? (e.g., develop mutual trust, friendship, and affinity with the client) before smoothly transitioning to asking about their problematic behavior. Keep the session under 40 turns and each response under 150 characters long. Use the MI principles and techniques described in the Knowledge Base – Motivational Interviewing (MI) context section below. However, these MI principles and techniques are only for you to use to help the user. These principles and techniques, as well as motivational interviewing, should NEVER be mentioned to the user.
+@backoff.on_exception(
+    backoff.expo,
+    (
+        openai.RateLimitError,
+        openai.Timeout,
+        openai.APIError,
+        openai.APIConnectionError,
+        openai.APIStatusError,
+        openai.InternalServerError,
+    ),
+)
+async def aget_precise_response(
+    messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1, max_tokens=150
+):
+    message = await acreate_chat_completion(
+        async_openai_client,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=max_tokens,
+    )
+    return message.choices[0].message.content
+
+
+@backoff.on_exception(
+    backoff.expo,
+    (
+        openai.RateLimitError,
+        openai.Timeout,
+        openai.APIError,
+        openai.APIConnectionError,
+        openai.APIStatusError,
+        openai.InternalServerError,
+    ),
+)
+async def aget_chatbot_response(
+    messages, model="gpt-3.5-turbo-0125", temperature=0.7, top_p=0.8, max_tokens=150
+):
+    message = await acreate_chat_completion(
+        async_openai_client,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=max_tokens,
+    )
+    return message.choices[0].message.content
+
 
-## Knowledge Base – Motivational Interviewing (MI)
+@timed("prompt")
+def counselor_system_prompt(goal, behavior, layout="default"):
+    instruction = f"""## Instruction
+You will act as a skilled counselor conducting a Motivational Interviewing (MI) session aimed at achieving {goal} related to the client's behavior, {behavior}. Your task is to help the client discover their inherent motivation to change and identify a tangible plan to change. Start the conversation with the client with some initial rapport building, such as asking, How are you? (e.g., develop mutual trust, friendship, and affinity with the client) before smoothly transitioning to asking about their problematic behavior. Keep the session under 40 turns and each response under 150 characters long. Use the MI principles and techniques described in the Knowledge Base – Motivational Interviewing (MI) context section below. However, these MI principles and techniques are only for you to use to help the user. These principles and techniques, as well as motivational interviewing, should NEVER be mentioned to the user.
+"""
+    knowledge_base = """## Knowledge Base – Motivational Interviewing (MI)
 Motivational Interviewing (MI) is a counseling approach designed to help individuals find the motivation to make positive behavioral changes. It is widely used in various fields such as health care, addiction treatment, and mental health. Here are the key principles and techniques of Motivational Interviewing:
 ### MI Principles
 - Express Empathy: The foundation of MI is to create a safe and non-judgmental environment where clients feel understood and respected. This involves actively listening and reflecting on what the client is saying, acknowledging their feelings, and showing genuine concern and understanding.
@@ -108,6 +165,20 @@ At the core of MI are a few basic principles, including expressing empathy and d
 - Reframe. The counselor suggests a different meaning for an experience expressed by the client, placing it in a new light.
 - Support. These are generally supportive, understanding comments that are not codable as Affirm or Reflect.
 """
+    if layout == "prefix":
+        # The knowledge base is the same for every profile, so it goes before the instruction
+        # that names the goal and behavior.
+        instruction = instruction.replace("section below", "section above")
+        return f"{knowledge_base}\n{instruction}"
+    return f"{instruction}\n{knowledge_base}"
+
+
+class Counselor:
+    def __init__(
+        self, goal, behavior, model, system_prompt=None, history=None, prompt_layout="default"
+    ):
+        if system_prompt is None:
+            system_prompt = counselor_system_prompt(goal, behavior, prompt_layout)
         first_counselor = """Counselor: Hello. How are you?"""
         first_client = """Client: I am good. What about you?"""
         self.messages = [
@@ -116,14 +187,28 @@ At the core of MI are a few basic principles, including expressing empathy and d
             {"role": "user", "content": first_client},
         ]
         self.model = model
+        self.history = history
+
+    @timed("prompt")
+    @accounted("counselor", "history_summary")
+    def prompt_messages(self):
+        if self.history is None:
+            return self.messages
+        return self.history.prepare(
+            self.messages, lambda prompt: get_precise_response(prompt, model=self.model)
+        )
 
     def receive(self, response):
         self.messages.append({"role": "user", "content": response})
 
+    @accounted("counselor", "reply")
     def reply(self):
         response = get_chatbot_response(
-            messages=self.messages, model=self.model, max_tokens=150
+            messages=self.prompt_messages(), model=self.model, max_tokens=150
         )
+        return self.finish_reply(response)
+
+    def finish_reply(self, response):
         response = " ".join(response.split("\n"))
         response = response.replace("*", "").replace("#", "")
         if not response.startswith("Counselor: "):
@@ -132,3 +217,32 @@ At the core of MI are a few basic principles, including expressing empathy and d
             response = response.split("Client: ")[0]
         self.messages.append({"role": "assistant", "content": response})
         return response
+
+    def state_dict(self):
+        return {
+            "messages": [dict(message) for message in self.messages],
+            "history": self.history.state_dict() if self.history else None,
+        }
+
+    def load_state_dict(self, state):
+        self.messages = [dict(message) for message in state["messages"]]
+        if self.history is not None and state["history"] is not None:
+            self.history.load_state_dict(state["history"])
+
+
+class AsyncCounselor(Counselor):
+    @timed("prompt")
+    @accounted("counselor", "history_summary")
+    async def prompt_messages(self):
+        if self.history is None:
+            return self.messages
+        return await self.history.aprepare(
+            self.messages, lambda prompt: aget_precise_response(prompt, model=self.model)
+        )
+
+    @accounted("counselor", "reply")
+    async def reply(self):
+        response = await aget_chatbot_response(
+            messages=await self.prompt_messages(), model=self.model, max_tokens=150
+        )
+        return self.finish_reply(response)
@@ -1,14 +1,21 @@
 import backoff
 import openai
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import re
 import copy
 import os
+import time
+import uuid
+from .accounting import Ledger, accounted, track_calls, untrack_calls
+from .checkpoint import load_checkpoint, remove_checkpoint, save_checkpoint
+from .llm import acreate_chat_completion, create_chat_completion
+from .profiling import timed
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 
 openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
 
 @backoff.on_exception(
@@ -22,7 +29,31 @@ openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
     ),
 )
 def get_precise_response(messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1):
-    message = openai_client.chat.completions.create(
+    message = create_chat_completion(
+        openai_client,
+        cache=True,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        top_p=top_p,
+    )
+    return message.choices[0].message.content
+
+
+@backoff.on_exception(
+    backoff.expo,
+    (
+        openai.RateLimitError,
+        openai.Timeout,
+        openai.APIError,
+        openai.APIConnectionError,
+        openai.APIStatusError,
+    ),
+)
+async def aget_precise_response(messages, model="gpt-3.5-turbo-0125", temperature=0.2, top_p=0.1):
+    message = await acreate_chat_completion(
+        async_openai_client,
+        cache=True,
         model=model,
         messages=messages,
         temperature=temperature,
@@ -43,7 +74,8 @@ def heuristic_moderator(context):
     return False
 
 
-def moderator(context):
+@timed("prompt")
+def moderator_prompt(context):
     user_prompt = """Your task is to assess the current state of the conversation (the most recent utterances) and determine whether the conversation has concluded.
 The conversation is considered to have concluded if any of the following conditions are met:
 - The Client and Counselor work out an actionable plan together.
@@ -116,7 +148,22 @@ Here is a new Conversation Snippet:
 Question: Should the conversation be concluded?
 """
     user_prompt = user_prompt.replace("[@context]", "\n".join(context[-5:]))
-    response = get_precise_response([{"role": "user", "content": user_prompt}])
+    return user_prompt
+
+
+@accounted("env", "moderator")
+def moderator(context):
+    response = get_precise_response([{"role": "user", "content": moderator_prompt(context)}])
+    if response and "yes" in response.lower():
+        return True
+    return False
+
+
+@accounted("env", "moderator")
+async def amoderator(context):
+    response = await aget_precise_response(
+        [{"role": "user", "content": moderator_prompt(context)}]
+    )
     if response and "yes" in response.lower():
         return True
     return False
@@ -133,52 +180,257 @@ class Env:
             "Client: I am good. What about you?",
         ],
         output_file=None,
+        end_classifier=None,
+        writer=None,
+        conversation_id=None,
+        checkpoint_path=None,
+        call_log=None,
     ):
         self.client = client
         self.counselor = counselor
         self.conversation = copy.deepcopy(initial_context)
         self.max_turns = max_turns
+        self.end_classifier = end_classifier
+        self.end_checks = {"classifier": 0, "moderator": 0}
+        self.writer = writer
+        self.conversation_id = conversation_id
+        self.checkpoint_path = checkpoint_path
+        self.turns = 0
+        self.end_reason = None
+        # Every run of a conversation writes its records under its own attempt id, so readers can
+        # tell a retry apart from what a failed run left behind. A resumed run keeps its id.
+        self.attempt = uuid.uuid4().hex
+        self.ledger = Ledger(conversation_id)
+        self.call_log = call_log
+        self.pending_records = []
+        self.output_path = output_file or (writer.path if writer is not None else None)
+        checkpoint = load_checkpoint(checkpoint_path) if checkpoint_path else None
+        self.output_file = None
+        self.resumed_output = False
         if output_file:
-            self.output_file = open(output_file, "w")
-            for context in self.conversation:
-                self.output_file.write(context + "\n")
-        else:
-            self.output_file = None
-            for context in self.conversation:
-                print(context)
+            if os.path.dirname(output_file):
+                os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            self.resumed_output = checkpoint is not None and os.path.exists(output_file)
+            self.output_file = open(output_file, "r+" if self.resumed_output else "w")
+        if checkpoint is not None:
+            self.load_state_dict(checkpoint)
+            return
+        for context in self.conversation:
+            self.output(context)
+            self.record(context.split(":")[0].lower(), context, 0, None)
 
+    @timed("io")
     def output(self, utterance):
-        if not os.path.exists(os.path.dirname(self.output_file)):
-            os.makedirs(os.path.dirname(self.output_file))
         if self.output_file:
             self.output_file.write(utterance + "\n")
-        else:
+        elif self.writer is None:
             print(utterance)
 
+    def record(self, speaker, utterance, turn, elapsed):
+        # Records are held back until the turn completes, so a resumed conversation does not
+        # repeat the half-finished turn it was interrupted in.
+        if self.writer is None:
+            return
+        record = {
+            "conversation": self.conversation_id,
+            "attempt": self.attempt,
+            "turn": turn,
+            "speaker": speaker,
+            "text": self.clean_utterance(utterance).strip(),
+            "elapsed": elapsed,
+        }
+        if speaker == "client" and turn:
+            record.update(self.client.last_turn)
+        self.pending_records.append(record)
+
+    def commit_records(self):
+        if self.writer is not None:
+            for record in self.pending_records:
+                self.writer.write(record)
+        self.pending_records = []
+        calls = self.ledger.drain()
+        if self.call_log is not None:
+            for call in calls:
+                self.call_log.write(call)
+
+    def state_dict(self):
+        return {
+            "conversation": list(self.conversation),
+            "attempt": self.attempt,
+            "turns": self.turns,
+            "end_checks": dict(self.end_checks),
+            "accounting": self.ledger.state_dict(),
+            "client": self.client.state_dict(),
+            "counselor": self.counselor.state_dict(),
+            "output_offset": self.output_file.tell() if self.output_file else None,
+        }
+
+    def load_state_dict(self, state):
+        self.conversation = list(state["conversation"])
+        self.attempt = state["attempt"]
+        self.turns = state["turns"]
+        self.end_checks = dict(state["end_checks"])
+        self.ledger.load_state_dict(state["accounting"])
+        self.client.load_state_dict(state["client"])
+        self.counselor.load_state_dict(state["counselor"])
+        if self.output_file and self.resumed_output and state["output_offset"] is not None:
+            # Drop whatever was written after the checkpoint.
+            self.output_file.seek(state["output_offset"])
+            self.output_file.truncate()
+        elif self.output_file:
+            # The transcript is gone, so it is written again from the conversation so far.
+            for context in self.conversation:
+                self.output(context)
+
+    def checkpoint(self):
+        self.commit_records()
+        if self.checkpoint_path is None:
+            return
+        for log in (self.writer, self.call_log):
+            if log is not None:
+                log.flush()
+        if self.output_file:
+            self.output_file.flush()
+        save_checkpoint(self.checkpoint_path, self.state_dict())
+
+    def finish(self, reason):
+        self.end_reason = reason
+        self.commit_records()
+        if self.writer is not None:
+            self.writer.write(
+                {
+                    "conversation": self.conversation_id,
+                    "attempt": self.attempt,
+                    "event": "end",
+                    "reason": reason,
+                    "turns": self.turns,
+                    "end_checks": self.end_checks,
+                    "history": self.history_metrics(),
+                    "accounting": self.ledger.state_dict(),
+                }
+            )
+        if self.checkpoint_path is not None:
+            remove_checkpoint(self.checkpoint_path)
+
+    def history_metrics(self):
+        # Prompt tokens sent and saved by the history policies, per agent.
+        return {
+            agent: speaker.history.metrics()
+            for agent, speaker in (("client", self.client), ("counselor", self.counselor))
+            if speaker.history is not None
+        }
+
+    @timed("io")
+    def close(self):
+        # The writers are shared by every conversation in the process, so they are only flushed here.
+        for log in (self.writer, self.call_log):
+            if log is not None:
+                log.flush()
+        if self.output_file:
+            self.output_file.close()
+            self.output_file = None
+
     def clean_utterance(self, utterance):
         utterance = re.sub(r"\[.*?\]", "", utterance)
         return utterance
 
+    def local_verdict(self, turn):
+        # True/False when the conversation end can be decided without the LLM moderator.
+        if heuristic_moderator(self.conversation):
+            return True
+        if turn <= 20:
+            return False
+        if self.end_classifier is not None:
+            verdict = self.end_classifier.predict(self.conversation)
+            if verdict is not None:
+                self.end_checks["classifier"] += 1
+                return verdict
+        return None
+
+    def concluded(self, turn):
+        verdict = self.local_verdict(turn)
+        if verdict is None:
+            self.end_checks["moderator"] += 1
+            verdict = moderator(self.conversation)
+        return verdict
+
     def interact(self):
-        for _ in range(self.max_turns):
-            counselor_response = self.counselor.reply()
-            self.output(counselor_response)
-            counselor_response = self.clean_utterance(counselor_response)
-            self.client.receive(counselor_response)
-            self.conversation.append(counselor_response)
-            if (heuristic_moderator(self.conversation)) or (
-                _ > 20 and moderator(self.conversation)
-            ):
-                break
-            client_response = self.client.reply()
-            if "Terminate" in client_response:
+        token = track_calls(self.ledger)
+        try:
+            reason = "max_turns"
+            for _ in range(self.turns, self.max_turns):
+                self.turns = _ + 1
+                self.ledger.turn = self.turns
+                start = time.perf_counter()
+                counselor_response = self.counselor.reply()
+                self.output(counselor_response)
+                self.record("counselor", counselor_response, self.turns, time.perf_counter() - start)
+                counselor_response = self.clean_utterance(counselor_response)
+                self.client.receive(counselor_response)
+                self.conversation.append(counselor_response)
+                if self.concluded(_):
+                    reason = "concluded"
+                    break
+                start = time.perf_counter()
+                client_response = self.client.reply()
+                self.output(client_response)
+                self.record("client", client_response, self.turns, time.perf_counter() - start)
+                if "Terminate" in client_response:
+                    reason = "terminated"
+                    break
+                client_response = self.clean_utterance(client_response)
+                self.counselor.receive(client_response)
+                self.conversation.append(client_response)
+                if self.concluded(_):
+                    reason = "concluded"
+                    break
+                self.checkpoint()
+            self.finish(reason)
+        finally:
+            untrack_calls(token)
+            self.close()
+
+
+class AsyncEnv(Env):
+    async def aconcluded(self, turn):
+        verdict = self.local_verdict(turn)
+        if verdict is None:
+            self.end_checks["moderator"] += 1
+            verdict = await amoderator(self.conversation)
+        return verdict
+
+    async def interact(self):
+        token = track_calls(self.ledger)
+        try:
+            reason = "max_turns"
+            for _ in range(self.turns, self.max_turns):
+                self.turns = _ + 1
+                self.ledger.turn = self.turns
+                start = time.perf_counter()
+                counselor_response = await self.counselor.reply()
+                self.output(counselor_response)
+                self.record("counselor", counselor_response, self.turns, time.perf_counter() - start)
+                counselor_response = self.clean_utterance(counselor_response)
+                self.client.receive(counselor_response)
+                self.conversation.append(counselor_response)
+                if await self.aconcluded(_):
+                    reason = "concluded"
+                    break
+                start = time.perf_counter()
+                client_response = await self.client.reply()
                 self.output(client_response)
-                break
-            self.output(client_response)
-            client_response = self.clean_utterance(client_response)
-            self.counselor.receive(client_response)
-            self.conversation.append(client_response)
-            if (heuristic_moderator(self.conversation)) or (
-                _ > 20 and moderator(self.conversation)
-            ):
-                break
+                self.record("client", client_response, self.turns, time.perf_counter() - start)
+                if "Terminate" in client_response:
+                    reason = "terminated"
+                    break
+                client_response = self.clean_utterance(client_response)
+                self.counselor.receive(client_response)
+                self.conversation.append(client_response)
+                if await self.aconcluded(_):
+                    reason = "concluded"
+                    break
+                self.checkpoint()
+            self.finish(reason)
+        finally:
+            untrack_calls(token)
+            self.close()
@@ -0,0 +1,172 @@
+import functools
+from .profiling import timing
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Room kept for a summary that is rewritten before the window is sent; the summarizer is asked
+# for at most 100 words.
+SUMMARY_TOKENS = 160
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@functools.lru_cache(maxsize=65536)
+def count_tokens(text, model=None):
+    # Exact with tiktoken, otherwise the same four-characters-per-token estimate the rate
+    # limiter uses.
+    if tiktoken is None:
+        return len(text) // 4
+    with timing("tokenization"):
+        return len(_encoding(model or "gpt-3.5-turbo").encode(text))
+
+
+def message_tokens(messages, model=None):
+    return sum(count_tokens(message["content"], model) + 4 for message in messages)
+
+
+class HistoryPolicy:
+    # Decides which part of an agent's message history is sent with each call. The agent keeps
+    # its full history; messages[0] is the system prompt and the last message is always sent.
+    def __init__(self, max_turns=None, max_tokens=None, summarize=False, stride=1, model=None):
+        if stride < 1:
+            raise ValueError("The history stride must be at least 1.")
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.stride = stride
+        self.model = model
+        self.summary = None
+        self.summarized = 1
+        self.calls = 0
+        self.full_tokens = 0
+        self.sent_tokens = 0
+        self.summary_tokens = 0
+
+    def window_start(self, messages):
+        # The window starts at the same role as the full history and only moves a whole stride
+        # of exchanges at a time, so the sent prefix stays put between moves.
+        last = len(messages) - 1
+        step = 2 * self.stride
+        start = 1
+        if self.max_turns is not None:
+            start = max(start, last - 2 * self.max_turns)
+        start = 1 + -(-(start - 1) // step) * step
+        if self.max_tokens is not None:
+            while (
+                start + step <= last
+                and self.system_tokens(messages, start) + message_tokens(messages[start:], self.model)
+                > self.max_tokens
+            ):
+                start += step
+        return min(start, max(last, 1))
+
+    def summary_for(self, start):
+        return self.summary if self.summarize and start > 1 else None
+
+    def system_message(self, messages, start):
+        # The summary is appended to the system prompt rather than sent as a message of its own,
+        # so the request keeps a single leading system message and alternating roles.
+        summary = self.summary_for(start)
+        if summary is None:
+            return messages[0]
+        return {
+            **messages[0],
+            "content": f"{messages[0]['content']}\n\nSummary of the earlier conversation: {summary}",
+        }
+
+    def system_tokens(self, messages, start):
+        # The summary only goes with windows past the first message, so the cost is counted per
+        # start. Past the summarized messages the summary is rewritten first, so room is kept for it.
+        tokens = message_tokens([self.system_message(messages, start)], self.model)
+        if self.summarize and start > self.summarized:
+            tokens += SUMMARY_TOKENS
+        return tokens
+
+    def summary_prompt(self, messages):
+        transcript = "\n".join(message["content"] for message in messages)
+        previous = f"Summary so far: {self.summary}\n\n" if self.summary else ""
+        prompt = f"""Summarize the earlier part of a counseling conversation so it can continue without the full transcript. Keep what the client revealed about their background, feelings, beliefs and plans, and what the counselor suggested. Write at most 100 words, without a preamble.
+
+{previous}Conversation:
+{transcript}"""
+        return [{"role": "user", "content": prompt}]
+
+    def pending_summary(self, messages):
+        # The messages that have left the window but are not in the summary yet.
+        if not self.summarize:
+            return None, None
+        start = self.window_start(messages)
+        if start <= self.summarized:
+            return None, None
+        return self.summary_prompt(messages[self.summarized : start]), start
+
+    def update_summary(self, prompt, summary, start):
+        self.summary = summary.strip()
+        self.summarized = start
+        self.summary_tokens += message_tokens(prompt, self.model) + count_tokens(
+            self.summary, self.model
+        )
+
+    def view(self, messages):
+        start = self.window_start(messages)
+        window = [self.system_message(messages, start)] + messages[start:]
+        self.calls += 1
+        self.full_tokens += message_tokens(messages, self.model)
+        self.sent_tokens += message_tokens(window, self.model)
+        return window
+
+    def prepare(self, messages, complete):
+        # complete(prompt) returns the summarizer's answer; it is only called when the window
+        # has moved past messages that are not summarized yet.
+        prompt, start = self.pending_summary(messages)
+        if prompt is not None:
+            self.update_summary(prompt, complete(prompt), start)
+        return self.view(messages)
+
+    async def aprepare(self, messages, complete):
+        prompt, start = self.pending_summary(messages)
+        if prompt is not None:
+            self.update_summary(prompt, await complete(prompt), start)
+        return self.view(messages)
+
+    def metrics(self):
+        return {
+            "calls": self.calls,
+            "full_prompt_tokens": self.full_tokens,
+            "prompt_tokens": self.sent_tokens,
+            "summary_tokens": self.summary_tokens,
+            "saved_tokens": self.full_tokens - self.sent_tokens - self.summary_tokens,
+        }
+
+    def state_dict(self):
+        return {
+            "summary": self.summary,
+            "summarized": self.summarized,
+            "calls": self.calls,
+            "full_tokens": self.full_tokens,
+            "sent_tokens": self.sent_tokens,
+            "summary_tokens": self.summary_tokens,
+        }
+
+    def load_state_dict(self, state):
+        self.summary = state["summary"]
+        self.summarized = state["summarized"]
+        self.calls = state["calls"]
+        self.full_tokens = state["full_tokens"]
+        self.sent_tokens = state["sent_tokens"]
+        self.summary_tokens = state["summary_tokens"]
+
+
+def merge_history_metrics(totals, metrics):
+    for k, v in metrics.items():
+        totals[k] = totals.get(k, 0) + v
+    return totals
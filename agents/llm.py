@@ -0,0 +1,135 @@
+import time
+from openai.types.chat import ChatCompletion
+from .accounting import current_ledger
+from .cache import ResponseCache
+from .profiling import timed
+
+_rate_limiter = None
+_response_cache = None
+
+
+def configure_rate_limiter(rate_limiter):
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+def get_rate_limiter():
+    return _rate_limiter
+
+
+def configure_response_cache(response_cache):
+    global _response_cache
+    _response_cache = response_cache
+
+
+def get_response_cache():
+    return _response_cache
+
+
+def _cache_key(kwargs):
+    return ResponseCache.make_key(
+        kwargs["model"],
+        kwargs["messages"],
+        kwargs.get("temperature"),
+        kwargs.get("top_p"),
+        kwargs.get("max_tokens"),
+        kwargs.get("response_format"),
+    )
+
+
+def _usable(message, accept):
+    if not message.choices or not message.choices[0].message.content:
+        return False
+    return accept is None or bool(accept(message.choices[0].message.content))
+
+
+def _lookup(response_cache, key, accept):
+    cached = response_cache.get(key)
+    if cached is None:
+        return None
+    message = ChatCompletion.model_validate_json(cached)
+    if not _usable(message, accept):
+        response_cache.reject(key)
+        return None
+    return message
+
+
+def _store(response_cache, key, kwargs, message, accept):
+    if _usable(message, accept):
+        response_cache.put(key, kwargs["model"], message.model_dump_json())
+
+
+def _record(kwargs, start, message=None, error=None, cache_hit=False):
+    ledger = current_ledger()
+    if ledger is not None:
+        ledger.record(
+            kwargs["model"],
+            time.perf_counter() - start,
+            usage=message.usage if message is not None and not cache_hit else None,
+            error=error,
+            cache_hit=cache_hit,
+        )
+
+
+@timed("llm")
+def create_chat_completion(openai_client, cache=False, accept=None, **kwargs):
+    # cache=True is only passed by the low-temperature classification helpers. Only answers
+    # accept(content) approves of are cached, so a caller retrying an unparsable answer reaches
+    # the API again instead of getting the same answer back.
+    start = time.perf_counter()
+    response_cache = _response_cache if cache else None
+    if response_cache is not None:
+        key = _cache_key(kwargs)
+        message = _lookup(response_cache, key, accept)
+        if message is not None:
+            _record(kwargs, start, message, cache_hit=True)
+            return message
+    rate_limiter = _rate_limiter
+    estimated_tokens = 0
+    if rate_limiter is not None:
+        estimated_tokens = rate_limiter.acquire(
+            kwargs["messages"], kwargs.get("max_tokens")
+        )
+    # Latency is measured from here, so waiting for the rate limiter does not count.
+    start = time.perf_counter()
+    try:
+        message = openai_client.chat.completions.create(**kwargs)
+    except Exception as e:
+        _record(kwargs, start, error=type(e).__name__)
+        raise
+    _record(kwargs, start, message)
+    if rate_limiter is not None:
+        rate_limiter.reconcile(estimated_tokens, message.usage)
+    if response_cache is not None:
+        _store(response_cache, key, kwargs, message, accept)
+    return message
+
+
+@timed("llm")
+async def acreate_chat_completion(openai_client, cache=False, accept=None, **kwargs):
+    start = time.perf_counter()
+    response_cache = _response_cache if cache else None
+    if response_cache is not None:
+        key = _cache_key(kwargs)
+        message = _lookup(response_cache, key, accept)
+        if message is not None:
+            _record(kwargs, start, message, cache_hit=True)
+            return message
+    rate_limiter = _rate_limiter
+    estimated_tokens = 0
+    if rate_limiter is not None:
+        estimated_tokens = await rate_limiter.aacquire(
+            kwargs["messages"], kwargs.get("max_tokens")
+        )
+    start = time.perf_counter()
+    try:
+        message = await openai_client.chat.completions.create(**kwargs)
+    except Exception as e:
+        _record(kwargs, start, error=type(e).__name__)
+        raise
+    _record(kwargs, start, message)
+    if rate_limiter is not None:
+        rate_limiter.reconcile(estimated_tokens, message.usage)
+    if response_cache is not None:
+        _store(response_cache, key, kwargs, message, accept)
+    return message
@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+import time
+from .profiling import timed
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                # A run killed mid-write leaves at most one partial last line; end it so the
+                # next entry starts on a line of its own.
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[(entry["sample"], entry["round"])] = entry
+
+    def is_finished(self, sample, round):
+        entry = self.entries.get((sample, round))
+        return entry is not None and entry["status"] == "finished"
+
+    @timed("io")
+    def record(self, sample, round, status, path, **info):
+        entry = {
+            "sample": sample,
+            "round": round,
+            "status": status,
+            "path": path,
+            "time": time.time(),
+            **info,
+        }
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            # A single O_APPEND write per entry, so concurrent writers never interleave lines.
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.entries[(sample, round)] = entry
+
+    def summary(self):
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
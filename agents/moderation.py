@@ -0,0 +1,243 @@
+import json
+import math
+import re
+import threading
+import numpy as np
+
+CLOSING_CUES = (
+    "goodbye",
+    "good bye",
+    "bye",
+    "take care",
+    "see you",
+    "next time",
+    "next week",
+    "talk soon",
+    "talk again",
+    "look forward",
+    "thank you for",
+    "thanks for",
+    "appreciate",
+    "pleasure",
+)
+PLAN_CUES = (
+    "plan",
+    "going to",
+    "i will",
+    "i'll",
+    "i can try",
+    "give it a",
+    "try to",
+    "cut back",
+    "step",
+    "goal",
+    "meet again",
+    "follow up",
+    "follow-up",
+)
+DEFER_CUES = (
+    "later time",
+    "another time",
+    "end the session",
+    "end this session",
+    "reflect",
+    "whenever you're ready",
+    "when you're ready",
+    "here to support",
+    "here for you",
+)
+ACKNOWLEDGEMENTS = {"okay", "ok", "yeah", "yes", "sure", "alright", "right", "thanks", "great", "good"}
+FEATURES = (
+    "closing_last",
+    "closing_previous",
+    "plan_window",
+    "defer_window",
+    "question_last",
+    "question_previous",
+    "length_last",
+    "acknowledgement_last",
+    "overlap_last",
+    "counselor_last",
+)
+
+
+def count_cues(text, cues):
+    text = text.lower()
+    return sum(cue in text for cue in cues)
+
+
+def words(text):
+    return re.findall(r"[\w']+", text.lower().split(": ", 1)[-1])
+
+
+def end_features(context):
+    # The same five-utterance window the LLM moderator sees.
+    window = context[-5:]
+    last = window[-1]
+    previous = window[-2] if len(window) > 1 else ""
+    last_words = words(last)
+    earlier_words = set(words(context[-3])) if len(context) >= 3 else set()
+    overlap = len(set(last_words) & earlier_words) / max(len(set(last_words)), 1)
+    return [
+        count_cues(last, CLOSING_CUES),
+        count_cues(previous, CLOSING_CUES),
+        sum(count_cues(utterance, PLAN_CUES) for utterance in window),
+        sum(count_cues(utterance, DEFER_CUES) for utterance in window),
+        float("?" in last),
+        float("?" in previous),
+        math.log1p(len(last_words)),
+        float(0 < len(last_words) <= 4 and set(last_words) <= ACKNOWLEDGEMENTS),
+        overlap,
+        float(last.startswith("Counselor")),
+    ]
+
+
+def session_contexts(sample, min_length=4, positive_tail=2):
+    # Every prefix of an annotated session is a training window; the windows ending in its
+    # last utterances count as concluded.
+    context = [
+        f"{'Client' if speaker == 'client' else 'Counselor'}: {utterance}"
+        for speaker, utterance in zip(sample["speakers"], sample["utterances"])
+    ]
+    windows = []
+    for end in range(min_length, len(context) + 1):
+        windows.append((context[:end], end > len(context) - positive_tail))
+    return windows
+
+
+def unique_sessions(samples):
+    sessions = {}
+    for sample in samples:
+        sessions.setdefault(tuple(sample["utterances"]), sample)
+    return list(sessions.values())
+
+
+def fit_logistic(x, y, l2=1.0, iterations=25):
+    # Newton's method on the class-balanced, L2-regularized log loss.
+    x = np.hstack([x, np.ones((len(x), 1))])
+    sample_weight = np.where(y == 1, 0.5 / max(y.sum(), 1), 0.5 / max((1 - y).sum(), 1))
+    sample_weight = sample_weight * len(y)
+    penalty = np.eye(x.shape[1]) * l2
+    penalty[-1, -1] = 0
+    weights = np.zeros(x.shape[1])
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-(x @ weights)))
+        gradient = x.T @ (sample_weight * (p - y)) + penalty @ weights
+        hessian = (x * (sample_weight * p * (1 - p))[:, None]).T @ x + penalty
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < 1e-6:
+            break
+    return weights[:-1], weights[-1]
+
+
+class EndClassifier:
+    def __init__(self, weights, bias, mean, scale, lower=0.2, upper=0.8):
+        self.weights = np.asarray(weights, dtype=float)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.lower = lower
+        self.upper = upper
+
+    @classmethod
+    def fit(cls, windows, l2=1.0):
+        x = np.array([end_features(context) for context, _ in windows], dtype=float)
+        y = np.array([label for _, label in windows], dtype=float)
+        mean = x.mean(axis=0)
+        scale = x.std(axis=0)
+        scale[scale == 0] = 1
+        weights, bias = fit_logistic((x - mean) / scale, y, l2=l2)
+        return cls(weights, bias, mean, scale)
+
+    def probability(self, context):
+        x = (np.array(end_features(context), dtype=float) - self.mean) / self.scale
+        return float(1 / (1 + np.exp(-(x @ self.weights + self.bias))))
+
+    def predict(self, context):
+        # True or False when confident, None when the LLM moderator should decide.
+        p = self.probability(context)
+        if p >= self.upper:
+            return True
+        if p <= self.lower:
+            return False
+        return None
+
+    def calibrate(self, probabilities, labels, tolerance=0.05):
+        # At most `tolerance` of the held-out concluded windows may fall below `lower`, and at
+        # most `tolerance` of the windows at or above `upper` may be ongoing. When no threshold
+        # is that precise, ending the session is always left to the LLM moderator.
+        positives = sorted(p for p, label in zip(probabilities, labels) if label)
+        if positives:
+            self.lower = min(positives[int(tolerance * len(positives))], 0.5)
+        self.upper = math.inf
+        ongoing = concluded = 0
+        for p, label in sorted(zip(probabilities, labels), reverse=True):
+            if p < 0.5:
+                break
+            concluded += label
+            ongoing += not label
+            if concluded and ongoing <= tolerance * (ongoing + concluded):
+                self.upper = p
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "features": list(FEATURES),
+                    "weights": self.weights.tolist(),
+                    "bias": self.bias,
+                    "mean": self.mean.tolist(),
+                    "scale": self.scale.tolist(),
+                    "lower": self.lower,
+                    "upper": self.upper,
+                },
+                f,
+                indent=2,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            params = json.load(f)
+        if params["features"] != list(FEATURES):
+            raise ValueError(f"{path} was trained on different features; retrain it.")
+        return cls(
+            params["weights"],
+            params["bias"],
+            params["mean"],
+            params["scale"],
+            params["lower"],
+            params["upper"],
+        )
+
+
+def cross_validate(sessions, l2=1.0):
+    # Leave-one-session-out probabilities for every window.
+    probabilities, labels = [], []
+    for i, session in enumerate(sessions):
+        train = [
+            window
+            for j, other in enumerate(sessions)
+            if j != i
+            for window in session_contexts(other)
+        ]
+        classifier = EndClassifier.fit(train, l2=l2)
+        for context, label in session_contexts(session):
+            probabilities.append(classifier.probability(context))
+            labels.append(label)
+    return probabilities, labels
+
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def load_end_classifier(path):
+    with _classifiers_lock:
+        classifier = _classifiers.get(path)
+        if classifier is None:
+            classifier = EndClassifier.load(path)
+            _classifiers[path] = classifier
+    return classifier
+
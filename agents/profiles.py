@@ -0,0 +1,184 @@
+import json
+import multiprocessing.util
+import os
+import tempfile
+import threading
+from .client import client_system_prompt
+from .counselor import counselor_system_prompt
+
+STORE_VERSION = 2
+
+
+def build_reference(sample, max_utterances=50):
+    reference = ""
+    for speaker, utterance in zip(
+        sample["speakers"][:max_utterances], sample["utterances"][:max_utterances]
+    ):
+        if speaker == "client":
+            reference += f"Client: {utterance}\n"
+        else:
+            reference += f"Counselor: {utterance}\n"
+    return reference
+
+
+def compile_profile(sample, layout="default"):
+    # Only what the simulation needs, with the client prompt assembled up front. The reference
+    # conversation is only used inside that prompt, so it is not stored separately.
+    reference = build_reference(sample)
+    return {
+        "goal": sample["topic"],
+        "behavior": sample["Behavior"],
+        "personas": sample["Personas"],
+        "initial_stage": sample["states"][0],
+        "final_stage": sample["states"][-1],
+        "motivation": sample["Motivation"],
+        "beliefs": sample["Beliefs"],
+        "plans": sample["Acceptable Plans"],
+        "receptivity": sum(sample["suggestibilities"]) / len(sample["suggestibilities"]),
+        "client_system_prompt": client_system_prompt(
+            sample["Behavior"],
+            sample["topic"],
+            reference,
+            sample["Personas"],
+            sample["Beliefs"],
+            layout,
+        ),
+        "num_utterances": len(sample["utterances"]),
+    }
+
+
+def source_fingerprint(profile_path, layout="default"):
+    stat = os.stat(profile_path)
+    return {
+        "version": STORE_VERSION,
+        "layout": layout,
+        "source": os.path.abspath(profile_path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+
+
+def replace_atomically(path, write, mode="w"):
+    # Each writer gets its own temporary file, so shards compiling the same store at once on
+    # shared storage never write into each other's output; the last rename wins.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".store-")
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        # mkstemp creates the file readable by its owner only.
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def compile_profiles(profile_path, store_dir, layout="default"):
+    # Writes one compact JSON line per profile plus the byte offset of every line, so a single
+    # profile can be read without parsing the rest. Counselor prompts only depend on the goal
+    # and behavior, so the few distinct ones are kept once in the index.
+    os.makedirs(store_dir, exist_ok=True)
+    offsets = []
+    counselor_prompts = {}
+
+    def write_profiles(dst):
+        with open(profile_path) as src:
+            for line in src:
+                if not line.strip():
+                    continue
+                profile = compile_profile(json.loads(line), layout)
+                prompt = counselor_system_prompt(profile["goal"], profile["behavior"], layout)
+                profile["counselor_prompt"] = counselor_prompts.setdefault(
+                    prompt, len(counselor_prompts)
+                )
+                offsets.append(dst.tell())
+                dst.write((json.dumps(profile, ensure_ascii=False) + "\n").encode("utf-8"))
+        offsets.append(dst.tell())
+
+    def write_index(f):
+        json.dump(
+            {
+                **source_fingerprint(profile_path, layout),
+                "offsets": offsets,
+                "counselor_system_prompts": list(counselor_prompts),
+            },
+            f,
+        )
+
+    replace_atomically(os.path.join(store_dir, "profiles.jsonl"), write_profiles, "wb")
+    replace_atomically(os.path.join(store_dir, "index.json"), write_index)
+
+
+def is_current(profile_path, store_dir, layout="default"):
+    index_path = os.path.join(store_dir, "index.json")
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path) as f:
+        index = json.load(f)
+    return all(index.get(k) == v for k, v in source_fingerprint(profile_path, layout).items())
+
+
+class ProfileStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "index.json")) as f:
+            index = json.load(f)
+        self.offsets = index["offsets"]
+        self.counselor_system_prompts = index["counselor_system_prompts"]
+        self._fd = os.open(os.path.join(store_dir, "profiles.jsonl"), os.O_RDONLY)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        # pread keeps concurrent readers from racing on a shared file position.
+        if self._fd is None:
+            raise ValueError(f"Profile store {self.store_dir} is closed.")
+        start, end = self.offsets[i], self.offsets[i + 1]
+        profile = json.loads(os.pread(self._fd, end - start, start))
+        profile["counselor_system_prompt"] = self.counselor_system_prompts[
+            profile.pop("counselor_prompt")
+        ]
+        return profile
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def close_profile_stores():
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.close()
+
+
+def load_profile_store(profile_path, store_dir=None, layout="default"):
+    # Compiles the store on first use, or again when profiles.jsonl has changed. Prompt layouts
+    # other than the default get their own store next to it.
+    suffix = ".store" if layout == "default" else f".{layout}.store"
+    store_dir = store_dir or os.path.splitext(profile_path)[0] + suffix
+    with _stores_lock:
+        store = _stores.get(store_dir)
+        if store is None:
+            if not _stores:
+                # Closed on interpreter exit, including in pool workers, like the transcript writers.
+                multiprocessing.util.Finalize(None, close_profile_stores, exitpriority=10)
+            if not is_current(profile_path, store_dir, layout):
+                compile_profiles(profile_path, store_dir, layout)
+            store = ProfileStore(store_dir)
+            _stores[store_dir] = store
+    return store
@@ -0,0 +1,172 @@
+import collections
+import contextlib
+import contextvars
+import cProfile
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+
+CATEGORIES = ("retrieval", "tokenization", "prompt", "llm", "io")
+
+_timings = contextvars.ContextVar("timings", default=None)
+_frame = contextvars.ContextVar("timing_frame", default=None)
+
+
+class Timings:
+    # Wall-clock seconds spent in each category by one conversation. Timers only count their
+    # own time, so a prompt whose history summary calls the LLM is split between both.
+    def __init__(self):
+        self.seconds = dict.fromkeys(CATEGORIES, 0.0)
+        self.calls = dict.fromkeys(CATEGORIES, 0)
+        self._lock = threading.Lock()
+
+    def add(self, category, seconds):
+        with self._lock:
+            self.seconds[category] += seconds
+            self.calls[category] += 1
+
+    def state_dict(self):
+        with self._lock:
+            return {"seconds": dict(self.seconds), "calls": dict(self.calls)}
+
+
+def track_time(timings):
+    # Like accounting.track_calls: timers in this context, including tasks it starts, add to
+    # `timings`. Threads need contextvars.copy_context().run to inherit it.
+    return _timings.set(timings)
+
+
+def untrack_time(token):
+    _timings.reset(token)
+
+
+@contextlib.contextmanager
+def timing(category):
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    parent = _frame.get()
+    frame = [0.0]
+    token = _frame.set(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _frame.reset(token)
+        if parent is not None:
+            parent[0] += elapsed
+        # Children running concurrently in threads or tasks can add up to more than this.
+        timings.add(category, max(elapsed - frame[0], 0.0))
+
+
+def timed(category):
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with timing(category):
+                    return await fn(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with timing(category):
+                    return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def merge_timings(totals, timings):
+    for key in ("seconds", "calls"):
+        for category, v in timings[key].items():
+            totals.setdefault(key, {})[category] = totals.get(key, {}).get(category, 0) + v
+    return totals
+
+
+def format_timings(timings):
+    return ", ".join(
+        f"{category} {timings['seconds'][category]:.2f}s ({timings['calls'][category]} calls)"
+        for category in CATEGORIES
+    )
+
+
+class CProfiler:
+    # Deterministic profile of the thread that starts it, written as pstats for snakeviz,
+    # gprof2dot or `python -m pstats`.
+    extension = ".pstats"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path + self.extension)
+
+
+class SamplingProfiler:
+    # Records the stack of every thread each `interval` seconds, written as collapsed stacks
+    # (one "thread;outer;...;inner count" line per stack) for flamegraph.pl or speedscope.
+    extension = ".folded"
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def dump(self, path):
+        with open(path + self.extension, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+PROFILERS = {"cprofile": CProfiler, "sampling": SamplingProfiler}
+
+
+def make_profiler(kind, interval=0.005):
+    if kind not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {kind}")
+    return PROFILERS[kind](interval) if kind == "sampling" else PROFILERS[kind]()
@@ -0,0 +1,85 @@
+import asyncio
+import multiprocessing
+import time
+
+
+def estimate_tokens(messages, max_tokens=None):
+    # Roughly four characters per token plus a few tokens of framing per message,
+    # and the completion budget counts against the quota up front.
+    prompt_tokens = sum(len(message["content"]) // 4 + 4 for message in messages)
+    return prompt_tokens + (max_tokens or 0)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, context=None):
+        # State lives in shared memory so one limiter can be handed to worker processes.
+        context = context or multiprocessing
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = context.Lock()
+        self._requests = context.Value("d", requests_per_minute or 0, lock=False)
+        self._tokens = context.Value("d", tokens_per_minute or 0, lock=False)
+        self._updated = context.Value("d", time.monotonic(), lock=False)
+
+    def _refill(self, now):
+        elapsed = now - self._updated.value
+        self._updated.value = now
+        if self.requests_per_minute:
+            self._requests.value = min(
+                self.requests_per_minute,
+                self._requests.value + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            self._tokens.value = min(
+                self.tokens_per_minute,
+                self._tokens.value + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def _reserve(self, tokens):
+        # Returns 0 once the request is admitted, otherwise the seconds to wait before retrying.
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = 0.0
+            if self.requests_per_minute and self._requests.value < 1:
+                wait = max(
+                    wait, (1 - self._requests.value) * 60 / self.requests_per_minute
+                )
+            if self.tokens_per_minute:
+                needed = min(tokens, self.tokens_per_minute)
+                if self._tokens.value < needed:
+                    wait = max(
+                        wait, (needed - self._tokens.value) * 60 / self.tokens_per_minute
+                    )
+            if wait > 0:
+                return wait
+            if self.requests_per_minute:
+                self._requests.value -= 1
+            if self.tokens_per_minute:
+                self._tokens.value -= tokens
+            return 0.0
+
+    def acquire(self, messages, max_tokens=None):
+        tokens = estimate_tokens(messages, max_tokens)
+        while True:
+            wait = self._reserve(tokens)
+            if not wait:
+                return tokens
+            time.sleep(wait)
+
+    async def aacquire(self, messages, max_tokens=None):
+        tokens = estimate_tokens(messages, max_tokens)
+        while True:
+            wait = self._reserve(tokens)
+            if not wait:
+                return tokens
+            await asyncio.sleep(wait)
+
+    def reconcile(self, estimated_tokens, usage):
+        # Give back (or charge) the difference between the estimate and the reported usage.
+        if not self.tokens_per_minute or usage is None:
+            return
+        with self._lock:
+            self._tokens.value = min(
+                self.tokens_per_minute,
+                self._tokens.value + estimated_tokens - usage.total_tokens,
+            )
@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer, AutoModelForSequenceClassification
+from .profiling import timed, timing
+
+
+class Retriever:
+    def __init__(self, path, device, max_length=512):
+        start = time.perf_counter()
+        self.path = path
+        self.device = device
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.model = AutoModelForSequenceClassification.from_pretrained(path).to(
+            device
+        )
+        self.model.eval()
+        self.load_time = time.perf_counter() - start
+        self.memory_footprint = self.model.get_memory_footprint()
+        self.num_parameters = sum(p.numel() for p in self.model.parameters())
+        self.num_clients = 0
+        self._passages = {}
+        self._passages_lock = threading.Lock()
+        # Fast tokenizers are not safe to call from several threads at once.
+        self._inference_lock = threading.Lock()
+
+    @timed("retrieval")
+    def encode_passages(self, key, passages):
+        # Passages only depend on (behavior, goal, corpus), so tokenize them once
+        # and splice in the query tokens on every turn.
+        with self._passages_lock:
+            passage_ids = self._passages.get(key)
+            if passage_ids is None:
+                with self._inference_lock, timing("tokenization"):
+                    passage_ids = self.tokenizer(
+                        list(passages),
+                        add_special_tokens=False,
+                        truncation=True,
+                        max_length=self.max_length,
+                    )["input_ids"]
+                self._passages[key] = passage_ids
+        return passage_ids
+
+    @timed("retrieval")
+    def score(self, query, passage_ids):
+        with self._inference_lock, timing("tokenization"):
+            query_ids = self.tokenizer(query, add_special_tokens=False)["input_ids"]
+            features = [
+                self.tokenizer.prepare_for_model(
+                    query_ids,
+                    ids,
+                    truncation="longest_first",
+                    max_length=self.max_length,
+                )
+                for ids in passage_ids
+            ]
+            inputs = self.tokenizer.pad(features, padding=True, return_tensors="pt")
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        with torch.no_grad():
+            batch_scores = (
+                self.model(**inputs, return_dict=True)
+                .logits.view(
+                    -1,
+                )
+                .float()
+            )
+            scores_sigmoid = torch.sigmoid(batch_scores)
+        return scores_sigmoid.tolist()
+
+    def stats(self):
+        return {
+            "kind": "cross-encoder",
+            "path": self.path,
+            "device": str(self.device),
+            "load_time": self.load_time,
+            "memory_footprint": self.memory_footprint,
+            "num_parameters": self.num_parameters,
+            "num_clients": self.num_clients,
+            "cached_passage_sets": len(self._passages),
+        }
+
+
+class Embedder:
+    def __init__(self, path, device, max_length=512, batch_size=16):
+        start = time.perf_counter()
+        self.path = path
+        self.device = device
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.model = AutoModel.from_pretrained(path).to(device)
+        self.model.eval()
+        self.load_time = time.perf_counter() - start
+        self.memory_footprint = self.model.get_memory_footprint()
+        self.num_parameters = sum(p.numel() for p in self.model.parameters())
+        self.num_clients = 0
+        self._passages = {}
+        self._passages_lock = threading.Lock()
+        # Fast tokenizers are not safe to call from several threads at once.
+        self._inference_lock = threading.Lock()
+
+    @timed("retrieval")
+    def encode(self, texts):
+        embeddings = []
+        with torch.no_grad():
+            for start in range(0, len(texts), self.batch_size):
+                with self._inference_lock, timing("tokenization"):
+                    inputs = self.tokenizer(
+                        list(texts[start : start + self.batch_size]),
+                        padding=True,
+                        truncation=True,
+                        return_tensors="pt",
+                        max_length=self.max_length,
+                    )
+                inputs = {k: v.to(self.device) for k, v in inputs.items()}
+                # CLS pooling with L2 normalization, as used by the BGE embedders.
+                outputs = self.model(**inputs, return_dict=True).last_hidden_state[:, 0]
+                outputs = torch.nn.functional.normalize(outputs.float(), dim=-1)
+                embeddings.append(outputs.cpu().numpy())
+        return np.concatenate(embeddings, axis=0)
+
+    def encode_passages(self, key, passages):
+        with self._passages_lock:
+            embeddings = self._passages.get(key)
+            if embeddings is None:
+                embeddings = self.encode(passages)
+                self._passages[key] = embeddings
+        return embeddings
+
+    def score(self, query, passage_embeddings):
+        query_embedding = self.encode([query])[0]
+        return (np.asarray(passage_embeddings) @ query_embedding).tolist()
+
+    def stats(self):
+        return {
+            "kind": "bi-encoder",
+            "path": self.path,
+            "device": str(self.device),
+            "load_time": self.load_time,
+            "memory_footprint": self.memory_footprint,
+            "num_parameters": self.num_parameters,
+            "num_clients": self.num_clients,
+            "cached_passage_sets": len(self._passages),
+        }
+
+
+class PassageIndex:
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "index.json")) as f:
+            meta = json.load(f)
+        self.index_dir = index_dir
+        self.embedder = meta["embedder"]
+        self.topics = meta["topics"]
+        self.rows = {(behavior, goal): i for i, (behavior, goal) in enumerate(meta["keys"])}
+        self.embeddings = np.load(
+            os.path.join(index_dir, "embeddings.npy"), mmap_mode="r"
+        )
+
+    def get(self, embedder, behavior, goal, topics):
+        if embedder.path != self.embedder:
+            raise ValueError(
+                f"Passage index {self.index_dir} was built with {self.embedder}, not {embedder.path}."
+            )
+        row = self.rows.get((behavior, goal))
+        if row is None or list(topics) != self.topics:
+            return None
+        return self.embeddings[row]
+
+
+def write_passage_index(index_dir, embedder_path, topics, keys, embeddings):
+    os.makedirs(index_dir, exist_ok=True)
+    array = np.lib.format.open_memmap(
+        os.path.join(index_dir, "embeddings.npy"),
+        mode="w+",
+        dtype=np.float32,
+        shape=(len(keys),) + tuple(embeddings[0].shape),
+    )
+    for row, embedding in enumerate(embeddings):
+        array[row] = embedding
+    array.flush()
+    del array
+    with open(os.path.join(index_dir, "index.json"), "w") as f:
+        json.dump(
+            {
+                "embedder": embedder_path,
+                "topics": list(topics),
+                "keys": [list(key) for key in keys],
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+
+_models = {}
+_models_lock = threading.Lock()
+_indexes = {}
+
+
+def default_device():
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def _load_model(cls, path, device):
+    # One eval-mode model per (kind, path, device) and process, shared by every Client.
+    device = torch.device(device) if device is not None else default_device()
+    key = (cls.__name__, path, str(device))
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = cls(path, device)
+            _models[key] = model
+        model.num_clients += 1
+    return model
+
+
+def load_retriever(path, device=None):
+    return _load_model(Retriever, path, device)
+
+
+def load_embedder(path, device=None):
+    return _load_model(Embedder, path, device)
+
+
+def load_passage_index(index_dir):
+    with _models_lock:
+        index = _indexes.get(index_dir)
+        if index is None:
+            index = PassageIndex(index_dir)
+            _indexes[index_dir] = index
+    return index
+
+
+def retriever_stats():
+    with _models_lock:
+        return [model.stats() for model in _models.values()]
@@ -0,0 +1,36 @@
+import heapq
+import math
+import os
+
+
+def expected_cost(profile, max_turns):
+    # Long annotated sessions tend to produce long simulated ones, and every persona and belief
+    # is a potential information-selection call on each turn.
+    turns = min(max_turns, math.ceil(profile["num_utterances"] / 2))
+    return turns * (1 + 0.1 * (len(profile["personas"]) + len(profile["beliefs"])))
+
+
+def assign_shards(costs, num_shards):
+    # Longest-processing-time-first: the most expensive job goes to the least loaded shard.
+    # Ties are broken by job order and shard index, so every node computes the same split.
+    loads = [(0.0, shard) for shard in range(num_shards)]
+    assignment = [None] * len(costs)
+    for job in sorted(range(len(costs)), key=lambda job: (-costs[job], job)):
+        load, shard = heapq.heappop(loads)
+        assignment[job] = shard
+        heapq.heappush(loads, (load + costs[job], shard))
+    return assignment
+
+
+def shard_dir(output_dir, shard_index, num_shards):
+    return os.path.join(output_dir, f"shard-{shard_index:03d}-of-{num_shards:03d}")
+
+
+def shard_jobs(store, rounds, max_turns, num_shards, shard_index):
+    jobs = [(i, j) for j in range(rounds) for i in range(len(store))]
+    if num_shards <= 1:
+        return jobs, sum(expected_cost(store[i], max_turns) for i, _ in jobs)
+    costs = [expected_cost(store[i], max_turns) for i in range(len(store))]
+    assignment = assign_shards([costs[i] for i, _ in jobs], num_shards)
+    mine = [job for job, shard in zip(jobs, assignment) if shard == shard_index]
+    return mine, sum(costs[i] for i, _ in mine)
@@ -0,0 +1,166 @@
+import gzip
+import io
+import json
+import multiprocessing.util
+import os
+import threading
+from .profiling import timed
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+SPEAKER_ORDER = {"counselor": 0, "client": 1}
+
+
+def transcript_path(output_dir, shard, compression=None):
+    return os.path.join(output_dir, f"transcripts-{shard}{EXTENSIONS[compression]}")
+
+
+class TranscriptWriter:
+    def __init__(self, path, compression=None, buffer_size=1 << 20):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown transcript compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd transcripts need the zstandard package: pip install zstandard")
+        self.path = path
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.records = 0
+        self.closed = False
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._compressor = zstandard.ZstdCompressor() if compression == "zstd" else None
+        self._file = open(path, "ab")
+        self._buffer = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    @timed("io")
+    def write(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self.closed:
+                raise ValueError(f"Transcript writer {self.path} is closed.")
+            self._buffer.append(line)
+            self._buffered += len(line)
+            self.records += 1
+            if self._buffered >= self.buffer_size:
+                self._flush()
+
+    def _flush(self):
+        # Every flush is written as a complete gzip member / zstd frame, so the file stays
+        # readable up to the last flush even if the process is killed afterwards.
+        if not self._buffer:
+            return
+        data = b"".join(self._buffer)
+        if self.compression == "gzip":
+            data = gzip.compress(data)
+        elif self.compression == "zstd":
+            data = self._compressor.compress(data)
+        self._file.write(data)
+        self._file.flush()
+        self._buffer = []
+        self._buffered = 0
+
+    @timed("io")
+    def flush(self):
+        with self._lock:
+            if not self.closed:
+                self._flush()
+
+    @timed("io")
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self._flush()
+            self._file.close()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_transcript(path):
+    if path.endswith(EXTENSIONS["gzip"]):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(EXTENSIONS["zstd"]):
+        if zstandard is None:
+            raise ImportError("zstd transcripts need the zstandard package: pip install zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_across_frames=True, closefd=True
+        )
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_transcripts(path):
+    with open_transcript(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_conversations(paths, conversations=None):
+    # Reads shards in the given order and yields the records of every conversation that ended,
+    # in the order of `conversations` if given, each ordered by turn and closed by its end record.
+    # Only the attempt that wrote the end record is kept, so a failed or retried run leaves no
+    # partial or duplicate turns behind; a turn that was repeated after resuming from a
+    # checkpoint keeps its latest version.
+    wanted = set(conversations) if conversations is not None else None
+    attempts = {}
+    ends = {}
+    for path in paths:
+        for record in read_transcripts(path):
+            conversation = record["conversation"]
+            if wanted is not None and conversation not in wanted:
+                continue
+            if record.get("event") == "end":
+                ends[conversation] = record
+                continue
+            turns = attempts.setdefault((conversation, record.get("attempt")), {})
+            turns[(record["turn"], SPEAKER_ORDER.get(record["speaker"], 2))] = record
+    for conversation in conversations if conversations is not None else list(ends):
+        end = ends.get(conversation)
+        if end is None:
+            continue
+        turns = attempts.get((conversation, end.get("attempt")), {})
+        # Records written before attempt ids all share one attempt, so turns past the end of the
+        # conversation are dropped as well.
+        for key in sorted(turns):
+            if key[0] <= end["turns"]:
+                yield turns[key]
+        yield end
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def close_transcript_writers():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+def open_transcript_writer(path, compression=None):
+    # One writer per shard and process. It is closed on interpreter exit, including in pool
+    # workers, which skip atexit handlers but run multiprocessing finalizers.
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            if not _writers:
+                multiprocessing.util.Finalize(
+                    None, close_transcript_writers, exitpriority=10
+                )
+            writer = TranscriptWriter(path, compression)
+            _writers[path] = writer
+    return writer
@@ -0,0 +1,393 @@
+from mock_server import start_mock_server
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+
+def summarize(samples, unit="s"):
+    samples = sorted(samples)
+    return {
+        "unit": unit,
+        "n": len(samples),
+        "mean": statistics.fmean(samples),
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        "min": samples[0],
+    }
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_samples(profile_path, limit):
+    with open(profile_path) as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    return samples[:limit] if limit else samples
+
+
+def counselor_queries(samples, count, rng):
+    utterances = [
+        utterance
+        for sample in samples
+        for speaker, utterance in zip(sample["speakers"], sample["utterances"])
+        if speaker != "client"
+    ]
+    return [f"Counselor: {utterance}" for utterance in rng.sample(utterances, min(count, len(utterances)))]
+
+
+def client_kwargs(args):
+    return dict(
+        wikipedia_dir=args.wikipedia_dir,
+        retriever_path=args.retriever_path,
+        retriever_device=args.retriever_device,
+        embedder_path=args.embedder_path,
+        embedding_index=args.embedding_index,
+        rerank_top_k=args.rerank_top_k,
+        bm25_candidates=args.bm25_candidates,
+    )
+
+
+def make_client(client_cls, profile, args, **kwargs):
+    return client_cls(
+        goal=profile["goal"],
+        behavior=profile["behavior"],
+        reference=None,
+        personas=list(profile["personas"]),
+        initial_stage=profile["initial_stage"],
+        final_stage=profile["final_stage"],
+        motivation=profile["motivation"],
+        beliefs=list(profile["beliefs"]),
+        plans=list(profile["plans"]),
+        receptivity=profile["receptivity"],
+        model=args.model,
+        system_prompt=profile["client_system_prompt"],
+        **client_kwargs(args),
+        **kwargs,
+    )
+
+
+def has_retrieval(args):
+    return bool(args.retriever_path or args.embedder_path)
+
+
+def bench_construction(args, store, results):
+    from agents import Client
+
+    profiles = [store[i % len(store)] for i in range(args.repeat + 1)]
+    start = time.perf_counter()
+    make_client(Client, profiles[0], args)
+    results["client_init/cold"] = summarize([time.perf_counter() - start])
+    iterator = iter(profiles[1:])
+    results["client_init/warm"] = measure(
+        lambda: make_client(Client, next(iterator), args), args.repeat, warmup=0
+    )
+
+
+def bench_retrieval(args, store, queries, results):
+    from agents import Client
+    import torch
+
+    client = make_client(Client, store[0], args)
+    topics = client.all_topics
+    full_scoring = not (args.embedder_path or args.bm25_candidates)
+    counts = args.passage_counts if full_scoring else [len(topics)]
+    counts = sorted({min(count, len(topics)) for count in counts})
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for count in counts:
+            # Scoring every passage ranks len(all_topics) of them, so a prefix stands in for a
+            # smaller knowledge base.
+            client.all_topics = topics[:count]
+            iterator = iter(queries * (args.repeat + 1))
+
+            def turn():
+                client.context.append(next(iterator))
+                client.top5_related_topics()
+
+            results[f"top5_related_topics/passages={count}/threads={threads}"] = measure(
+                turn, args.repeat
+            )
+        client.all_topics = topics
+        iterator = iter(queries * (args.repeat + 1))
+
+        def advance():
+            client.state = "Precontemplation"
+            client.context.append(next(iterator))
+            client.advance_state()
+
+        results[f"advance_state/threads={threads}"] = measure(advance, args.repeat)
+
+
+def bench_graph(args, store, results, rng):
+    from agents.client import Client
+    from agents.topics import load_knowledge_base, shortest_distances
+
+    knowledge_base = load_knowledge_base(args.wikipedia_dir)
+    graph = knowledge_base.graph
+    nodes = list(graph)
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(args.repeat * 10)]
+    # One Dijkstra run per lookup, as the client did before the distances were precomputed.
+    def dijkstra(start_node, target_node):
+        return shortest_distances(graph, start_node).get(target_node, float("infinity"))
+
+    iterator = iter(pairs * 2)
+    results["dijkstra"] = measure(lambda: dijkstra(*next(iterator)), len(pairs), warmup=0)
+    iterator = iter(pairs * 2)
+    results["topic_distance"] = measure(
+        lambda: knowledge_base.distance(*next(iterator)), len(pairs), warmup=0
+    )
+
+    class Engagement:
+        # Just the attributes update_engagement reads and writes.
+        def __init__(self, profile):
+            self.knowledge_base = knowledge_base
+            self.engagemented_topics = profile["motivation"][:-1]
+            self.context = []
+            self.error_topic_count = 0
+            self.engagement = profile["receptivity"]
+
+    engagement = Engagement(store[0])
+    topics = iter([rng.choice(knowledge_base.topics) for _ in range(len(pairs) + 1)])
+    results["update_engagement"] = measure(
+        lambda: Client.update_engagement(engagement, next(topics)), len(pairs), warmup=0
+    )
+
+
+def bench_moderator(args, samples, results):
+    from agents.env import heuristic_moderator
+    from agents.moderation import load_end_classifier
+
+    contexts = [
+        [
+            f"{'Client' if speaker == 'client' else 'Counselor'}: {utterance}"
+            for speaker, utterance in zip(sample["speakers"][:end], sample["utterances"][:end])
+        ]
+        for sample in samples
+        for end in range(3, len(sample["utterances"]) + 1)
+    ]
+    iterator = iter(contexts * 2)
+    results["heuristic_moderator"] = measure(
+        lambda: heuristic_moderator(next(iterator)), len(contexts), warmup=0
+    )
+    if args.end_classifier:
+        classifier = load_end_classifier(args.end_classifier)
+        iterator = iter(contexts * 2)
+        results["end_classifier"] = measure(
+            lambda: classifier.predict(next(iterator)), len(contexts), warmup=0
+        )
+
+
+def build_env(args, store, i, asynchronous=False, executor=None):
+    from agents import AsyncClient, AsyncCounselor, AsyncEnv, Client, Counselor, Env
+
+    counselor_cls, client_cls, env_cls = (
+        (AsyncCounselor, AsyncClient, AsyncEnv) if asynchronous else (Counselor, Client, Env)
+    )
+    profile = store[i % len(store)]
+    counselor = counselor_cls(
+        goal=profile["goal"],
+        behavior=profile["behavior"],
+        model=args.model,
+        system_prompt=profile["counselor_system_prompt"],
+    )
+    kwargs = {"executor": executor} if asynchronous else {}
+    client = make_client(client_cls, profile, args, **kwargs)
+    return env_cls(
+        client=client,
+        counselor=counselor,
+        output_file=os.devnull,
+        max_turns=args.max_turns,
+        conversation_id=f"Benchmark-{i}",
+    )
+
+
+def bench_conversations(args, store, results):
+    from concurrent.futures import ThreadPoolExecutor
+
+    for concurrency in args.concurrency:
+        envs = []
+        start = time.perf_counter()
+        if concurrency <= 1:
+            for i in range(args.conversations):
+                env = build_env(args, store, i)
+                env.interact()
+                envs.append(env)
+        else:
+            executor = ThreadPoolExecutor(max_workers=4)
+
+            async def run_all():
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def run(i):
+                    async with semaphore:
+                        env = build_env(args, store, i, asynchronous=True, executor=executor)
+                        await env.interact()
+                        envs.append(env)
+
+                await asyncio.gather(*(run(i) for i in range(args.conversations)))
+
+            try:
+                asyncio.run(run_all())
+            finally:
+                executor.shutdown()
+        elapsed = time.perf_counter() - start
+        turns = sum(env.turns for env in envs)
+        calls = sum(env.ledger.summary["total"]["calls"] for env in envs)
+        results[f"conversations/concurrency={concurrency}"] = {
+            "unit": "conversations/min",
+            "n": len(envs),
+            "conversations_per_minute": len(envs) / elapsed * 60,
+            "turns_per_second": turns / elapsed,
+            "llm_calls_per_conversation": calls / max(len(envs), 1),
+            "elapsed": elapsed,
+        }
+
+
+def headline(result):
+    # The number compared across runs, and whether higher is better.
+    if "conversations_per_minute" in result:
+        return result["conversations_per_minute"], True
+    return result["median"], False
+
+
+def compare(previous, results, max_regression):
+    regressions = []
+    print(f"{'benchmark':<48} {'before':>12} {'after':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        before, higher_is_better = headline(previous[name])
+        after, _ = headline(result)
+        change = (after - before) / before if before else 0.0
+        slower = -change if higher_is_better else change
+        print(f"{name:<48} {before:>12.6g} {after:>12.6g} {change:>+8.1%}")
+        if max_regression is not None and slower > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--suites", default="construction,retrieval,graph,moderator,conversations", type=str, help="Comma-separated benchmarks to run")
+    parser.add_argument("--output", default="./benchmark.json", type=str, help="Where to write the results")
+    parser.add_argument("--compare", default=None, type=str, help="Results of an earlier run to compare against")
+    parser.add_argument("--max_regression", default=None, type=float, help="Exit with an error if a benchmark got slower than this fraction (e.g. 0.2) compared to --compare")
+    parser.add_argument("--repeat", default=20, type=int, help="Timed repetitions per micro benchmark")
+    parser.add_argument("--seed", default=0, type=int, help="Seed for the sampled queries and topic pairs")
+    parser.add_argument("--model", default="gpt-3.5-turbo-0125", type=str, help="Model name sent to the LLM backend")
+    parser.add_argument("--retriever_path", default=None, type=str, help="Cross-encoder for topic retrieval; retrieval and conversations are skipped without a retriever or embedder")
+    parser.add_argument("--retriever_device", default=None, type=str, help="Device for the retrieval models")
+    parser.add_argument("--embedder_path", default=None, type=str, help="Bi-encoder for dense topic retrieval")
+    parser.add_argument("--embedding_index", default=None, type=str, help="Directory of precomputed passage embeddings")
+    parser.add_argument("--rerank_top_k", default=0, type=int, help="Rerank the top-k dense candidates with the cross-encoder")
+    parser.add_argument("--bm25_candidates", default=0, type=int, help="Rerank only the top BM25 candidates with the cross-encoder")
+    parser.add_argument("--passage_counts", default="8,32,128", type=str, help="Passage counts for full cross-encoder scoring")
+    parser.add_argument("--threads", default="1,4", type=str, help="torch thread counts for retrieval")
+    parser.add_argument("--end_classifier", default=None, type=str, help="Also time the end-of-session classifier written by train_moderator.py")
+    parser.add_argument("--wikipedia_dir", default="./wikipedias", type=str, help="The directory containing the wikipedia articles.")
+    parser.add_argument(
+        "--profile_path", default="./annotations/profiles.jsonl", type=str, help="Path to the profiles.jsonl file"
+    )
+    parser.add_argument("--profile_store", default=None, type=str, help="Directory of preprocessed profiles")
+    parser.add_argument("--conversations", default=4, type=int, help="Conversations per concurrency level")
+    parser.add_argument("--concurrency", default="1,4", type=str, help="Concurrency levels for the conversation benchmark")
+    parser.add_argument("--max_turns", default=20, type=int, help="Maximum number of turns for each conversation")
+    parser.add_argument("--base_url", default=None, type=str, help="OpenAI-compatible endpoint for the conversations; defaults to a local mock server")
+    parser.add_argument("--mock_latency", default=0.0, type=float, help="Seconds each mock response takes")
+
+    args = parser.parse_args()
+    args.passage_counts = [int(n) for n in args.passage_counts.split(",")]
+    args.threads = [int(n) for n in args.threads.split(",")]
+    args.concurrency = [int(n) for n in args.concurrency.split(",")]
+    suites = args.suites.split(",")
+
+    # The agents create their OpenAI clients at import time, so the endpoint is set first.
+    server = None
+    if "conversations" in suites and args.base_url is None:
+        server, args.base_url = start_mock_server(latency=args.mock_latency, seed=args.seed)
+        os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "mock"
+    if args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+    from agents.profiles import close_profile_stores, load_profile_store
+
+    rng = random.Random(args.seed)
+    store = load_profile_store(args.profile_path, args.profile_store)
+    samples = load_samples(args.profile_path, 20)
+    queries = counselor_queries(samples, args.repeat, rng)
+    results = {}
+    skipped = []
+    for suite in suites:
+        print(f"Running {suite}...", file=sys.stderr)
+        if suite == "construction":
+            bench_construction(args, store, results)
+        elif suite == "retrieval":
+            if has_retrieval(args):
+                bench_retrieval(args, store, queries, results)
+            else:
+                skipped.append(suite)
+        elif suite == "graph":
+            bench_graph(args, store, results, rng)
+        elif suite == "moderator":
+            bench_moderator(args, samples, results)
+        elif suite == "conversations":
+            if has_retrieval(args):
+                bench_conversations(args, store, results)
+            else:
+                skipped.append(suite)
+        else:
+            parser.error(f"Unknown suite {suite}")
+    close_profile_stores()
+    if server is not None:
+        server.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "time": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "skipped": skipped,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, result in results.items():
+        value, higher_is_better = headline(result)
+        unit = result["unit"] if higher_is_better else f"{result['unit']} median"
+        print(f"{name:<48} {value:>12.6g} {unit}")
+    if skipped:
+        print(f"Skipped without --retriever_path or --embedder_path: {', '.join(skipped)}")
+    print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f)["results"], results, args.max_regression)
+        if regressions:
+            print(f"Regressed by more than {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
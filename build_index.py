@@ -0,0 +1,41 @@
+from agents.retriever import load_embedder, write_passage_index
+from agents.topics import load_knowledge_base
+import json
+from tqdm import tqdm
+import argparse
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--embedder_path", type=str, help="The bi-encoder used to embed the topic passages.")
+    parser.add_argument("--wikipedia_dir", default="./wikipedias", type=str, help="The directory containing the wikipedia articles.")
+    parser.add_argument(
+        "--profile_path", default="./annotations/profiles.jsonl", type=str, help="Path to the profiles.jsonl file"
+    )
+    parser.add_argument(
+        "--index_dir", default="./passage_index", type=str, help="Output directory for the memory-mapped passage embeddings"
+    )
+    parser.add_argument("--device", default=None, type=str, help="Device for the embedder, defaults to cuda when available.")
+
+    args = parser.parse_args()
+
+    with open(args.profile_path) as f:
+        samples = [json.loads(line) for line in f]
+
+    knowledge_base = load_knowledge_base(args.wikipedia_dir)
+    embedder = load_embedder(args.embedder_path, args.device)
+    topics = knowledge_base.topics
+    keys = []
+    embeddings = []
+    for sample in tqdm(samples, desc="Embedding"):
+        key = (sample["Behavior"], sample["topic"])
+        if key in keys:
+            continue
+        # The same passages and cache key a Client builds, so the indexed texts match retrieval exactly.
+        passages = knowledge_base.passages(*key)
+        keys.append(key)
+        embeddings.append(embedder.encode_passages((*key, args.wikipedia_dir), passages))
+
+    write_passage_index(args.index_dir, args.embedder_path, topics, keys, embeddings)
+    print(f"Wrote {len(keys)} passage sets x {len(topics)} topics to {args.index_dir}")
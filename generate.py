@@ -1,80 +1,608 @@
-from agents import Env, Counselor, Client
+from agents import AsyncClient, AsyncCounselor, AsyncEnv, Env, Counselor, Client
+from agents.accounting import configure_prices, format_summary, merge_summaries
+from agents.cache import ResponseCache
+from agents.history import HistoryPolicy, merge_history_metrics
+from agents.llm import configure_rate_limiter, configure_response_cache, get_response_cache
+from agents.manifest import Manifest
+from agents.moderation import load_end_classifier
+from agents.profiles import close_profile_stores, load_profile_store
+from agents.profiling import Timings, format_timings, make_profiler, merge_timings, track_time, untrack_time
+from agents.ratelimit import RateLimiter
+from agents.retriever import retriever_stats
+from agents.sharding import shard_dir, shard_jobs
+from agents.writer import open_transcript_writer, transcript_path
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextlib
 import json
+import multiprocessing
+import numpy as np
+import time
 from tqdm import tqdm
 import os
 import argparse
 
+
+def history_policy(args):
+    # A fresh policy per agent, since it carries that agent's summary and token counts.
+    if args.history_turns is None and args.history_tokens is None:
+        return None
+    return HistoryPolicy(
+        max_turns=args.history_turns,
+        max_tokens=args.history_tokens,
+        summarize=args.history_summary,
+        stride=args.history_stride,
+        model=args.model,
+    )
+
+
+def conversation_seed(args, i, j):
+    # Fixed per conversation, so a run with --seed gives the same transcripts in any order.
+    if args.seed is None:
+        return None
+    return int(np.random.SeedSequence([args.seed, i, j]).generate_state(1)[0])
+
+
+def build_env(args, i, j, asynchronous=False, executor=None):
+    profile = load_profile_store(args.profile_path, args.profile_store, args.prompt_layout)[i]
+    counselor_cls, client_cls, env_cls = (
+        (AsyncCounselor, AsyncClient, AsyncEnv)
+        if asynchronous
+        else (Counselor, Client, Env)
+    )
+    client_kwargs = {"executor": executor} if asynchronous else {}
+    counselor = counselor_cls(
+        goal=profile["goal"],
+        behavior=profile["behavior"],
+        model=args.model,
+        system_prompt=profile["counselor_system_prompt"],
+        history=history_policy(args),
+    )
+    client = client_cls(
+        goal=profile["goal"],
+        behavior=profile["behavior"],
+        reference=None,
+        personas=profile["personas"],
+        initial_stage=profile["initial_stage"],
+        final_stage=profile["final_stage"],
+        motivation=profile["motivation"],
+        beliefs=profile["beliefs"],
+        plans=profile["plans"],
+        receptivity=profile["receptivity"],
+        model=args.model,
+        system_prompt=profile["client_system_prompt"],
+        wikipedia_dir=args.wikipedia_dir,
+        retriever_path=args.retriever_path,
+        retriever_device=args.retriever_device,
+        embedder_path=args.embedder_path,
+        embedding_index=args.embedding_index,
+        rerank_top_k=args.rerank_top_k,
+        bm25_candidates=args.bm25_candidates,
+        measure_agreement=args.measure_agreement,
+        concurrent_steps=args.concurrent_steps,
+        speculative_information=args.speculative_information,
+        information_mode=args.information_mode,
+        fused_decision=args.fused_decision,
+        history=history_policy(args),
+        seed=conversation_seed(args, i, j),
+        **client_kwargs,
+    )
+    end_classifier = None
+    if args.end_classifier:
+        end_classifier = load_end_classifier(args.end_classifier)
+    output_file = None
+    writer = None
+    if args.transcript_format == "jsonl":
+        # One shard per process, shared by all of its conversations.
+        writer = open_transcript_writer(
+            transcript_path(args.output_dir, os.getpid(), args.compression),
+            args.compression,
+        )
+    else:
+        output_file = os.path.join(args.output_dir, f"Sample-{i}-Round-{j}.txt")
+    return env_cls(
+        client=client,
+        counselor=counselor,
+        output_file=output_file,
+        max_turns=args.max_turns,
+        end_classifier=end_classifier,
+        writer=writer,
+        conversation_id=f"Sample-{i}-Round-{j}",
+        call_log=(
+            open_transcript_writer(os.path.join(args.output_dir, f"calls-{os.getpid()}.jsonl"))
+            if args.call_log
+            else None
+        ),
+        checkpoint_path=(
+            os.path.join(args.checkpoint_dir, f"Sample-{i}-Round-{j}.pkl")
+            if args.checkpoint_dir
+            else None
+        ),
+    )
+
+
+@contextlib.contextmanager
+def profiled(args, i, j):
+    # Times one conversation by category and, with --profile conversation, also profiles it.
+    if not args.profile:
+        yield None
+        return
+    timings = Timings()
+    token = track_time(timings)
+    profiler = None
+    if args.profile == "conversation":
+        profiler = make_profiler(args.profiler, args.profile_interval)
+        profiler.start()
+    try:
+        yield timings
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.dump(os.path.join(args.profile_dir, f"Sample-{i}-Round-{j}"))
+        untrack_time(token)
+
+
+def record_finished(manifest, env, i, j, usage_totals, timings=None):
+    history = env.history_metrics()
+    profile = timings.state_dict() if timings is not None else None
+    manifest.record(
+        i,
+        j,
+        "finished",
+        env.output_path,
+        reason=env.end_reason,
+        turns=env.turns,
+        accounting=env.ledger.state_dict(),
+        **({"history": history} if history else {}),
+        **({"profile": profile} if profile else {}),
+    )
+    count_usage(usage_totals, history, env.ledger.state_dict(), profile)
+
+
+def count_usage(totals, history, accounting, profile=None):
+    for agent, metrics in history.items():
+        merge_history_metrics(totals["history"].setdefault(agent, {}), metrics)
+    merge_summaries(totals["accounting"], accounting)
+    if profile:
+        merge_timings(totals["profile"], profile)
+
+
+def count_end_checks(totals, end_checks):
+    for k, v in end_checks.items():
+        totals[k] += v
+
+
+def report_failure(manifest, failures, i, j, e):
+    error = f"{type(e).__name__}: {e}"
+    failures.append({"sample": i, "round": j, "error": error})
+    manifest.record(i, j, "failed", None, error=error)
+    tqdm.write(f"Sample-{i}-Round-{j} failed: {error}")
+
+
+def print_throughput(finished, failed, elapsed, setting):
+    print(
+        f"{finished} conversations finished and {failed} failed in {elapsed:.1f}s "
+        f"{setting} ({finished / elapsed * 60 if elapsed else 0:.2f} conversations per minute)"
+    )
+
+
+def run_sequential(args, jobs, agreement, end_checks, manifest, usage_totals):
+    # A failed conversation is reported and the run moves on to the next one.
+    start = time.perf_counter()
+    failures = []
+    finished = 0
+    progress = tqdm(jobs, desc="Conversations")
+    for i, j in progress:
+        try:
+            with profiled(args, i, j) as timings:
+                env = build_env(args, i, j)
+                env.interact()
+        except Exception as e:
+            report_failure(manifest, failures, i, j, e)
+        else:
+            finished += 1
+            record_finished(manifest, env, i, j, usage_totals, timings)
+            agreement.extend(env.client.retrieval_agreement)
+            count_end_checks(end_checks, env.end_checks)
+        progress.set_postfix(finished=finished, failed=len(failures))
+    print_throughput(finished, len(failures), time.perf_counter() - start, "one at a time")
+    return failures
+
+
+async def run_async(args, jobs, agreement, end_checks, manifest, usage_totals):
+    # One event loop drives many conversations; the semaphore caps how many are in flight.
+    # A failed conversation is reported without cancelling the others.
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    executor = ThreadPoolExecutor(max_workers=args.retrieval_threads)
+    failures = []
+    finished = 0
+
+    async def run(i, j):
+        nonlocal finished
+        async with semaphore:
+            try:
+                with profiled(args, i, j) as timings:
+                    env = build_env(args, i, j, asynchronous=True, executor=executor)
+                    await env.interact()
+            except Exception as e:
+                report_failure(manifest, failures, i, j, e)
+                return
+            finished += 1
+            record_finished(manifest, env, i, j, usage_totals, timings)
+            agreement.extend(env.client.retrieval_agreement)
+            count_end_checks(end_checks, env.end_checks)
+
+    tasks = [asyncio.ensure_future(run(i, j)) for i, j in jobs]
+    try:
+        progress = tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Conversations")
+        for task in progress:
+            await task
+            progress.set_postfix(finished=finished, failed=len(failures))
+    finally:
+        executor.shutdown()
+    print_throughput(
+        finished, len(failures), time.perf_counter() - start, f"with concurrency {args.concurrency}"
+    )
+    return failures
+
+_worker_args = None
+_worker_profiler = None
+
+
+def configure_cache(args):
+    if args.cache_path:
+        configure_response_cache(
+            ResponseCache(args.cache_path, max_entries=args.cache_max_entries)
+        )
+
+
+def cache_stats():
+    response_cache = get_response_cache()
+    return response_cache.stats() if response_cache else {"hits": 0, "misses": 0}
+
+
+def init_worker(args, rate_limiter):
+    global _worker_args, _worker_profiler
+    _worker_args = args
+    if args.profile == "run":
+        # Each worker profiles its whole lifetime into its own file, rewritten after every job.
+        _worker_profiler = make_profiler(args.profiler, args.profile_interval)
+        _worker_profiler.start()
+    if args.prices:
+        configure_prices(args.prices)
+    configure_rate_limiter(rate_limiter)
+    configure_cache(args)
+
+
+def run_job(job):
+    # Runs inside a pool worker; a failed conversation is reported, not raised.
+    i, j = job
+    start = time.perf_counter()
+    cache_before = cache_stats()
+    result = {
+        "sample": i,
+        "round": j,
+        "status": "finished",
+        "error": None,
+        "agreement": [],
+        "end_checks": {},
+        "profile": None,
+    }
+    try:
+        with profiled(_worker_args, i, j) as timings:
+            env = build_env(_worker_args, i, j)
+            env.interact()
+        result["agreement"] = env.client.retrieval_agreement
+        result["end_checks"] = env.end_checks
+        result["path"] = env.output_path
+        result["reason"] = env.end_reason
+        result["turns"] = env.turns
+        result["history"] = env.history_metrics()
+        result["accounting"] = env.ledger.state_dict()
+        result["profile"] = timings.state_dict() if timings is not None else None
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    if _worker_profiler is not None:
+        _worker_profiler.stop()
+        _worker_profiler.dump(os.path.join(_worker_args.profile_dir, f"run-{os.getpid()}"))
+        _worker_profiler.start()
+    result["elapsed"] = time.perf_counter() - start
+    result["cache"] = {
+        k: v - cache_before[k] for k, v in cache_stats().items()
+    }
+    return result
+
+
+def run_pool(args, jobs, agreement, end_checks, manifest, rate_limiter, context, cache_totals, usage_totals):
+    # Spawned workers each load the retriever once and pull jobs one at a time from the pool queue.
+    start = time.perf_counter()
+    failures = []
+    finished = 0
+    with context.Pool(
+        args.workers, initializer=init_worker, initargs=(args, rate_limiter)
+    ) as pool:
+        progress = tqdm(
+            pool.imap_unordered(run_job, jobs, chunksize=1),
+            total=len(jobs),
+            desc="Conversations",
+        )
+        for result in progress:
+            for k, v in result["cache"].items():
+                cache_totals[k] += v
+            if result["status"] == "finished":
+                finished += 1
+                manifest.record(
+                    result["sample"],
+                    result["round"],
+                    "finished",
+                    result["path"],
+                    reason=result["reason"],
+                    turns=result["turns"],
+                    accounting=result["accounting"],
+                    **({"history": result["history"]} if result["history"] else {}),
+                    **({"profile": result["profile"]} if result["profile"] else {}),
+                )
+                agreement.extend(result["agreement"])
+                count_end_checks(end_checks, result["end_checks"])
+                count_usage(usage_totals, result["history"], result["accounting"], result["profile"])
+            else:
+                failures.append(result)
+                manifest.record(
+                    result["sample"], result["round"], "failed", None, error=result["error"]
+                )
+                tqdm.write(
+                    f"Sample-{result['sample']}-Round-{result['round']} failed: {result['error']}"
+                )
+            progress.set_postfix(finished=finished, failed=len(failures))
+        # Let the workers exit normally so their transcript shards are closed.
+        pool.close()
+        pool.join()
+    print_throughput(
+        finished, len(failures), time.perf_counter() - start, f"with {args.workers} workers"
+    )
+    return failures
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--model", type=str, help="OpenAI model to use for the agents")
     parser.add_argument("--retriever_path", type=str, help="The retriever model to use in client simulation.")
+    parser.add_argument("--retriever_device", default=None, type=str, help="Device for the retriever model, defaults to cuda when available.")
+    parser.add_argument("--embedder_path", default=None, type=str, help="Bi-encoder for dense topic retrieval; the cross-encoder is then only used for reranking.")
+    parser.add_argument("--embedding_index", default=None, type=str, help="Directory of precomputed passage embeddings written by build_index.py.")
+    parser.add_argument("--rerank_top_k", default=0, type=int, help="Rerank the top-k dense candidates with the cross-encoder (0 disables reranking).")
+    parser.add_argument("--bm25_candidates", default=0, type=int, help="Rerank only the top BM25 candidates with the cross-encoder (0 scores every passage).")
+    parser.add_argument("--measure_agreement", action="store_true", help="Also score every passage and report how often the BM25-prefiltered top-1 topic agrees.")
+    parser.add_argument("--concurrent_steps", action="store_true", help="Request the client's action distribution while the state update is still running.")
+    parser.add_argument("--speculative_information", default=0, type=int, help="With --concurrent_steps, also match personas/beliefs for the N most likely actions ahead of sampling.")
+    parser.add_argument("--information_mode", default="sequential", choices=["sequential", "batched"], help="Ask about each persona/belief in turn, or judge all of them in one JSON request (falling back to sequential on an unusable answer).")
+    parser.add_argument("--fused_decision", action="store_true", help="Get the motivation verdict, action distribution, question check and persona choice from one JSON request per turn.")
     parser.add_argument("--wikipedia_dir", default="./wikipedias", type=str, help="The directory containing the wikipedia articles.")
     parser.add_argument(
         "--profile_path", default="./annotations/profiles.jsonl", type=str, help="Path to the profiles.jsonl file"
     )
+    parser.add_argument(
+        "--profile_store",
+        default=None,
+        type=str,
+        help="Directory of preprocessed profiles, compiled from --profile_path whenever it changes (defaults to <profile_path without .jsonl>.store)",
+    )
     parser.add_argument(
         "--output_dir",
         type=str,
         default="./Output",
         help="Output directory to save the generated conversations",
     )
+    parser.add_argument(
+        "--transcript_format",
+        default="txt",
+        choices=["txt", "jsonl"],
+        help="One text file per conversation, or one JSON record per turn in per-process JSONL shards",
+    )
+    parser.add_argument(
+        "--compression", default=None, choices=["gzip", "zstd"], help="Compress JSONL transcript shards"
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Append-only record of finished conversations used to skip them on reruns (defaults to <output_dir>/manifest.jsonl)",
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=str,
+        default=None,
+        help="Checkpoint every conversation after each turn so an interrupted run resumes from its last completed turn",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Seed the action sampling and persona choices of every conversation"
+    )
     parser.add_argument(
         "--round", type=int, default=5, help="Number of rounds to run the simulation"
     )
     parser.add_argument(
         "--max_turns", type=int, default=20, help="Maximum number of turns for each conversation"
     )
+    parser.add_argument(
+        "--concurrency", type=int, default=0, help="Run up to this many conversations concurrently on one asyncio event loop (0 runs them one by one)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=0, help="Distribute conversations over this many worker processes (0 runs in this process)"
+    )
+    parser.add_argument(
+        "--num_shards", type=int, default=1, help="Split the profile x round matrix into this many shards, e.g. one per machine"
+    )
+    parser.add_argument(
+        "--shard_index", type=int, default=0, help="Which shard this run generates; output goes to <output_dir>/shard-<index>-of-<num_shards>"
+    )
+    parser.add_argument(
+        "--history_turns", type=int, default=None, help="Send each agent only its last N exchanges (plus the system prompt) instead of the full history"
+    )
+    parser.add_argument(
+        "--history_tokens", type=int, default=None, help="Drop the oldest exchanges until each agent's prompt fits this many tokens (counted with tiktoken when installed)"
+    )
+    parser.add_argument(
+        "--history_summary", action="store_true", help="Replace exchanges dropped by --history_turns/--history_tokens with a rolling LLM summary"
+    )
+    parser.add_argument(
+        "--history_stride", type=int, default=1, help="Move the history window this many exchanges at a time, so the prompt prefix and summary change less often"
+    )
+    parser.add_argument(
+        "--prompt_layout",
+        default="default",
+        choices=["default", "prefix"],
+        help="With prefix, the system prompts start with the text shared by every profile, so a server-side prefix cache is reused across conversations",
+    )
+    parser.add_argument(
+        "--prices", type=str, default=None, help="JSON file of model -> [input, cached input, output] US$ per million tokens, added to the built-in price table"
+    )
+    parser.add_argument(
+        "--call_log", action="store_true", help="Write every LLM call, tagged with conversation, turn, agent and step, to <output_dir>/calls-<pid>.jsonl"
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        choices=["conversation", "run"],
+        help="Profile every conversation into <profile_dir>/Sample-<i>-Round-<j>, or the whole run (one file per worker process), and report the time spent in retrieval, tokenization, prompt assembly, LLM calls and file I/O",
+    )
+    parser.add_argument(
+        "--profiler",
+        default="cprofile",
+        choices=["cprofile", "sampling"],
+        help="cprofile writes .pstats of the main thread; sampling writes .folded stacks of every thread for flamegraph.pl or speedscope",
+    )
+    parser.add_argument(
+        "--profile_interval", type=float, default=0.005, help="Seconds between samples of the sampling profiler"
+    )
+    parser.add_argument(
+        "--profile_dir", type=str, default=None, help="Where to write the profiles (defaults to <output_dir>/profiles)"
+    )
+    parser.add_argument(
+        "--requests_per_minute", type=int, default=None, help="Request budget shared by all agents, threads and workers"
+    )
+    parser.add_argument(
+        "--tokens_per_minute", type=int, default=None, help="Token budget shared by all agents, threads and workers"
+    )
+    parser.add_argument(
+        "--cache_path", type=str, default=None, help="SQLite file caching deterministic classification calls across rounds and reruns"
+    )
+    parser.add_argument(
+        "--cache_max_entries", type=int, default=100000, help="Least recently used responses are evicted beyond this many entries"
+    )
+    parser.add_argument(
+        "--end_classifier", type=str, default=None, help="End-of-session classifier written by train_moderator.py; the LLM moderator is only asked when it is unsure"
+    )
+    parser.add_argument(
+        "--retrieval_threads", type=int, default=4, help="Threads used for retrieval when running with --concurrency"
+    )
 
     args = parser.parse_args()
 
-    with open(args.profile_path) as f:
-        lines = f.readlines()
-    for j in range(args.round):
-        for i in tqdm(range(len(lines)), desc=f"Round-{j}"):
-            sample = json.loads(lines[i])
-            if os.path.exists(f"./Output/Sample-{i}-Round-{j}.txt"):
-                with open(f"./Output/Sample-{i}-Round-{j}.txt") as f:
-                    temp_lines = f.readlines()
-                    if (
-                        len(temp_lines) > 40
-                        or "You are motivated because" in temp_lines[-1]
-                        or "You should highlight current state and engagement, express a desire to end the current session"
-                        in temp_lines[-1]
-                    ):
-                        continue
-            goal = sample["topic"]
-            behavior = sample["Behavior"]
-            counselor = Counselor(goal=goal, behavior=behavior, model=args.model)
-            reference = ""
-            for speaker, utterance in zip(
-                sample["speakers"][:50], sample["utterances"][:50]
-            ):
-                if speaker == "client":
-                    reference += f"Client: {utterance}\n"
-                else:
-                    reference += f"Counselor: {utterance}\n"
-            client = Client(
-                goal=sample["topic"],
-                behavior=sample["Behavior"],
-                reference=reference,
-                personas=sample["Personas"],
-                initial_stage=sample["states"][0],
-                final_stage=sample["states"][-1],
-                motivation=sample["Motivation"],
-                beliefs=sample["Beliefs"],
-                plans=sample["Acceptable Plans"],
-                receptivity=sum(sample["suggestibilities"])
-                / len(sample["suggestibilities"]),
-                model=args.model,
-                wikipedia_dir=args.wikipedia_dir,
-                retriever_path=args.retriever_path,
+    context = multiprocessing.get_context("spawn")
+    rate_limiter = None
+    if args.requests_per_minute or args.tokens_per_minute:
+        rate_limiter = RateLimiter(
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=args.tokens_per_minute,
+            context=context,
+        )
+        configure_rate_limiter(rate_limiter)
+    configure_cache(args)
+    if args.prices:
+        configure_prices(args.prices)
+    cache_totals = {"hits": 0, "misses": 0}
+
+    if not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard_index must be in [0, --num_shards)")
+    store = load_profile_store(args.profile_path, args.profile_store, args.prompt_layout)
+    jobs, cost = shard_jobs(
+        store, args.round, args.max_turns, args.num_shards, args.shard_index
+    )
+    if args.num_shards > 1:
+        # Workers read the output directory from args, so point it at this shard's directory.
+        args.output_dir = shard_dir(args.output_dir, args.shard_index, args.num_shards)
+        print(
+            f"Shard {args.shard_index}/{args.num_shards}: {len(jobs)} conversations, "
+            f"expected cost {cost:.0f}"
+        )
+    if args.profile == "conversation" and args.workers == 0 and args.concurrency > 1:
+        parser.error("--profile conversation needs one conversation at a time per process; use --workers or --profile run")
+    if args.profile:
+        args.profile_dir = args.profile_dir or os.path.join(args.output_dir, "profiles")
+        os.makedirs(args.profile_dir, exist_ok=True)
+    manifest = Manifest(args.manifest or os.path.join(args.output_dir, "manifest.jsonl"))
+    jobs = [(i, j) for i, j in jobs if not manifest.is_finished(i, j)]
+    agreement = []
+    end_checks = {"classifier": 0, "moderator": 0}
+    usage_totals = {"history": {}, "accounting": {}, "profile": {}}
+    run_profiler = None
+    if args.profile == "run" and args.workers == 0:
+        run_profiler = make_profiler(args.profiler, args.profile_interval)
+        run_profiler.start()
+    if args.workers > 0 or args.concurrency > 0:
+        if args.workers > 0:
+            run_pool(
+                args, jobs, agreement, end_checks, manifest, rate_limiter, context, cache_totals, usage_totals
             )
-            env = Env(
-                client=client,
-                counselor=counselor,
-                output_file=f"./output/Sample-{i}-Round-{j}.txt",
-                max_turns=args.max_turns,
+        else:
+            asyncio.run(run_async(args, jobs, agreement, end_checks, manifest, usage_totals))
+    else:
+        run_sequential(args, jobs, agreement, end_checks, manifest, usage_totals)
+    if run_profiler is not None:
+        run_profiler.stop()
+        run_profiler.dump(os.path.join(args.profile_dir, "run"))
+    close_profile_stores()
+
+    if args.cache_path:
+        if args.workers == 0:
+            cache_totals = cache_stats()
+        print(
+            f"Response cache {args.cache_path}: {cache_totals['hits']} hits, {cache_totals['misses']} misses"
+        )
+    if agreement:
+        print(
+            f"BM25 top-{args.bm25_candidates} prefilter agrees with full scoring on the top-1 topic "
+            f"in {sum(agreement)}/{len(agreement)} turns ({sum(agreement) / len(agreement):.1%})"
+        )
+    if args.end_classifier:
+        print(
+            f"End-of-session checks: {end_checks['classifier']} decided by {args.end_classifier}, "
+            f"{end_checks['moderator']} sent to the LLM moderator"
+        )
+    accounting = usage_totals["accounting"]
+    if accounting:
+        with open(os.path.join(args.output_dir, "accounting.json"), "w") as f:
+            json.dump(accounting, f, indent=2)
+        usage = accounting["total"]
+        print(
+            f"LLM calls: {usage['calls']} ({usage['cache_hits']} from the response cache, {usage['retries']} retried), "
+            f"{usage['prompt_tokens']} prompt and {usage['completion_tokens']} completion tokens, "
+            f"estimated cost ${usage['cost']:.4f}"
+            + (f" ({usage['unpriced_calls']} calls to models without a price)" if usage["unpriced_calls"] else "")
+        )
+        print(format_summary(accounting))
+        if usage["prompt_tokens"]:
+            print(
+                f"{usage['cached_tokens']} prompt tokens served from the provider's prefix cache "
+                f"({usage['cached_tokens'] / usage['prompt_tokens']:.1%})"
             )
-            env.interact()
+    for agent, totals in sorted(usage_totals["history"].items()):
+        print(
+            f"{agent.capitalize()} history: {totals['prompt_tokens']} of {totals['full_prompt_tokens']} prompt tokens sent "
+            f"over {totals['calls']} calls, {totals['summary_tokens']} spent on summaries, {totals['saved_tokens']} saved"
+        )
+    if usage_totals["profile"]:
+        with open(os.path.join(args.profile_dir, "timings.json"), "w") as f:
+            json.dump(usage_totals["profile"], f, indent=2)
+        print(f"Time by category: {format_timings(usage_totals['profile'])}")
+        print(f"Profiles written to {args.profile_dir}")
+    for stats in retriever_stats():
+        print(
+            f"{stats['kind'].capitalize()} {stats['path']} on {stats['device']}: loaded once in {stats['load_time']:.2f}s, "
+            f"{stats['memory_footprint'] / 2**20:.1f} MiB, {stats['num_parameters']} parameters, "
+            f"shared by {stats['num_clients']} clients"
+        )
@@ -0,0 +1,102 @@
+from agents.manifest import Manifest
+from agents.profiles import close_profile_stores, load_profile_store
+from agents.writer import EXTENSIONS, TranscriptWriter, read_conversations, transcript_path
+import argparse
+import glob
+import json
+import os
+import shutil
+
+
+def merge_transcripts(shard, conversations, writer):
+    # Shard files are read oldest first. Each conversation keeps only the attempt that wrote its
+    # end record, so turns left behind by a failed attempt are not merged after its real ending.
+    paths = [
+        path
+        for path in glob.glob(os.path.join(shard, "transcripts-*"))
+        if path.endswith(tuple(EXTENSIONS.values()))
+    ]
+    for record in read_conversations(sorted(paths, key=os.path.getmtime), conversations):
+        writer.write(record)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--output_dir", default="./Output", type=str, help="Directory holding the shard-*-of-* directories written by generate.py")
+    parser.add_argument("--merged_dir", default=None, type=str, help="Where to write the merged dataset (defaults to <output_dir>/merged)")
+    parser.add_argument(
+        "--profile_path", default="./annotations/profiles.jsonl", type=str, help="Path to the profiles.jsonl file"
+    )
+    parser.add_argument("--profile_store", default=None, type=str, help="Directory of preprocessed profiles")
+    parser.add_argument("--prompt_layout", default="default", choices=["default", "prefix"], help="Prompt layout the shards were generated with")
+    parser.add_argument("--round", type=int, default=5, help="Number of rounds the shards were generated with")
+    parser.add_argument("--compression", default=None, choices=["gzip", "zstd"], help="Compression of the merged JSONL transcripts")
+
+    args = parser.parse_args()
+
+    merged_dir = args.merged_dir or os.path.join(args.output_dir, "merged")
+    shards = sorted(glob.glob(os.path.join(args.output_dir, "shard-*-of-*")))
+    if not shards:
+        parser.error(f"No shard directories found in {args.output_dir}")
+    if os.path.exists(os.path.join(merged_dir, "manifest.jsonl")):
+        parser.error(f"{merged_dir} already holds a merged manifest")
+    os.makedirs(merged_dir, exist_ok=True)
+
+    # The latest finished entry wins; a failure only counts if the job never finished anywhere.
+    entries = {}
+    for shard in shards:
+        for key, entry in Manifest(os.path.join(shard, "manifest.jsonl")).entries.items():
+            rank = (entry["status"] == "finished", entry["time"])
+            previous = entries.get(key)
+            if previous is None or rank > previous[0]:
+                entries[key] = (rank, shard, entry)
+
+    merged = Manifest(os.path.join(merged_dir, "manifest.jsonl"))
+    writer = None
+    for shard in shards:
+        conversations = []
+        for (i, j), (_, entry_shard, entry) in sorted(entries.items()):
+            if entry_shard != shard:
+                continue
+            info = {k: v for k, v in entry.items() if k not in ("sample", "round", "status", "path", "time")}
+            path = entry["path"]
+            if entry["status"] == "finished" and path and path.endswith(".txt"):
+                path = os.path.join(merged_dir, os.path.basename(path))
+                shutil.copyfile(entry["path"], path)
+            elif entry["status"] == "finished" and path:
+                if writer is None:
+                    writer = TranscriptWriter(
+                        transcript_path(merged_dir, "merged", args.compression), args.compression
+                    )
+                conversations.append(f"Sample-{i}-Round-{j}")
+                path = writer.path
+            merged.record(i, j, entry["status"], path, shard=os.path.basename(shard), **info)
+        if conversations:
+            merge_transcripts(shard, conversations, writer)
+    if writer is not None:
+        writer.close()
+
+    store = load_profile_store(args.profile_path, args.profile_store, args.prompt_layout)
+    expected = {(i, j) for j in range(args.round) for i in range(len(store))}
+    close_profile_stores()
+    missing = sorted(expected - set(entries))
+    failed = sorted(key for key, (_, _, entry) in entries.items() if entry["status"] != "finished")
+    report = {
+        "shards": [os.path.basename(shard) for shard in shards],
+        "expected": len(expected),
+        "finished": len(entries) - len(failed),
+        "failed": [{"sample": i, "round": j, "error": entries[(i, j)][2].get("error")} for i, j in failed],
+        "missing": [{"sample": i, "round": j} for i, j in missing],
+    }
+    with open(os.path.join(merged_dir, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    print(
+        f"Merged {len(shards)} shards into {merged_dir}: {report['finished']}/{len(expected)} finished, "
+        f"{len(failed)} failed, {len(missing)} missing"
+    )
+    for job in report["failed"][:20]:
+        print(f"  failed Sample-{job['sample']}-Round-{job['round']}: {job['error']}")
+    for job in report["missing"][:20]:
+        print(f"  missing Sample-{job['sample']}-Round-{job['round']}")
@@ -0,0 +1,318 @@
+import argparse
+import collections
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Probability that a rule answers Yes (or picks a persona) for each kind of check.
+RATES = {"motivation": 0.2, "question": 0.7, "persona": 0.4, "end": 0.15}
+
+COUNSELOR_UTTERANCES = (
+    "How have things been going for you lately?",
+    "What brings you here today?",
+    "It sounds like this has been on your mind. Can you tell me more about it?",
+    "What do you enjoy about it, and what worries you about it?",
+    "On a scale from 1 to 10, how important is it for you to make a change?",
+    "You know yourself best. What would a first step look like for you?",
+    "It sounds like you care a lot about your health and the people around you.",
+    "What might get in the way if you decided to cut back?",
+    "Would it be okay if I shared some information about that?",
+    "That makes sense. How do you feel about trying that this week?",
+)
+CLIENT_UTTERANCES = (
+    "I don't really think it's that big of a deal, honestly.",
+    "Everyone around me does it too, so it feels normal.",
+    "I guess it's been a bit stressful at work lately.",
+    "Sometimes I worry about it, but I'm not sure I want to change.",
+    "I've tried to cut back before, but it didn't last long.",
+    "Yeah, I suppose that could be a problem for me.",
+    "Maybe I could try to do it less on weekdays.",
+    "I don't know, it's just how I relax after a long day.",
+    "That's fair. I'll think about it.",
+    "Okay, I can give that a try and see how it goes.",
+)
+ACTIONS = ("Deny", "Downplay", "Blame", "Inform", "Engage")
+
+
+def request_seed(body, seed):
+    # The same request always gets the same answer, however requests are interleaved.
+    payload = json.dumps([seed, body.get("model"), body.get("messages")], sort_keys=True)
+    return int(hashlib.md5(payload.encode("utf-8")).hexdigest(), 16)
+
+
+def action_distribution(rng, actions):
+    weights = [rng.random() + 0.05 for _ in actions]
+    distribution = {action: int(100 * w / sum(weights)) for action, w in zip(actions, weights)}
+    distribution[actions[0]] += 100 - sum(distribution.values())
+    return distribution
+
+
+def numbered(text):
+    return re.findall(r"^\s*(\d+)\. ", text, flags=re.MULTILINE)
+
+
+def pick(rng, count, rate):
+    return rng.randint(1, count) if count and rng.random() < rate else 0
+
+
+def json_reply(rng, prompt):
+    if '"information": For each' in prompt or '"actions": Allocate' in prompt:
+        decision = {}
+        if '"motivation":' in prompt:
+            motivated = rng.random() < RATES["motivation"]
+            decision["motivation"] = {
+                "analysis": "The Counselor's statement addresses the Client's motivation."
+                if motivated
+                else "The Counselor's statement does not address the Client's motivation.",
+                "motivated": motivated,
+            }
+        if '"actions":' in prompt:
+            decision["actions"] = action_distribution(rng, ACTIONS)
+            decision["question"] = rng.random() < RATES["question"]
+        information = {}
+        for action, listing in re.findall(
+            r"^  - (\w+): Which .*?\n((?:    \d+\. .*\n?)+)", prompt, flags=re.MULTILINE
+        ):
+            information[action] = pick(rng, len(numbered(listing)), RATES["persona"])
+        if information:
+            decision["information"] = information
+        return decision
+    if "Which of these personas can" in prompt:
+        persona = pick(rng, len(numbered(prompt)), RATES["persona"])
+        return {
+            "reason": "The persona fits the question." if persona else "None of them fits.",
+            "persona": persona,
+        }
+    actions = re.findall(r"^- (\w+): ", prompt, flags=re.MULTILINE)
+    if actions:
+        return action_distribution(rng, actions)
+    return {}
+
+
+def fresh_utterance(rng, utterances, messages):
+    # Never repeats one of the speaker's last three turns, which the environment would take
+    # for the end of the conversation.
+    recent = [m["content"] for m in messages if m["role"] == "assistant"][-3:]
+    return rng.choice([u for u in utterances if not any(u in r for r in recent)])
+
+
+def rule_reply(body, rng):
+    messages = body.get("messages") or [{"role": "user", "content": ""}]
+    system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+    prompt = messages[-1]["content"] or ""
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps(json_reply(rng, prompt))
+    if prompt.startswith("Summarize the earlier part"):
+        return "The client talked about their habits and the counselor asked about their reasons to change."
+    if "Question: Can the Counselor's statement motivate the Client?" in prompt:
+        answer = "Yes" if rng.random() < RATES["motivation"] else "No"
+        return f"Analysis: The Counselor's statement was compared with the Client's motivation.\nAnswer: {answer}"
+    if "Question: Should the conversation be concluded?" in prompt:
+        answer = "Yes" if rng.random() < RATES["end"] else "No"
+        return f"Conversation State: The Client and Counselor are discussing the behavior.\nEnd or Not: {answer}"
+    if "? Yes or No" in prompt:
+        rate = RATES["question"] if "Is there a question" in prompt else RATES["persona"]
+        return "Yes" if rng.random() < rate else "No"
+    if "skilled counselor" in system:
+        return f"Counselor: {fresh_utterance(rng, COUNSELOR_UTTERANCES, messages)}"
+    if "Client" in system:
+        return f"Client: {fresh_utterance(rng, CLIENT_UTTERANCES, messages)}"
+    return "No"
+
+
+def load_script(path):
+    # A JSON list of {"pattern": regex, "response": text}, tried against the last message
+    # before the built-in rules.
+    with open(path) as f:
+        return [(re.compile(rule["pattern"]), rule["response"]) for rule in json.load(f)]
+
+
+def count_tokens(text):
+    return len(text) // 4 + 1
+
+
+class PrefixCache:
+    # Approximates a server-side prefix cache at message granularity: a request is served from
+    # the cache up to the longest run of leading messages an earlier request already sent.
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.prefixes = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, messages):
+        cached = 0
+        tokens = 0
+        digest = hashlib.md5()
+        with self.lock:
+            for message in messages:
+                digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+                tokens += count_tokens(message.get("content") or "") + 4
+                key = digest.hexdigest()
+                if key in self.prefixes:
+                    self.prefixes.move_to_end(key)
+                    cached = tokens
+                else:
+                    self.prefixes[key] = tokens
+            while len(self.prefixes) > self.capacity:
+                self.prefixes.popitem(last=False)
+        return tokens, cached
+
+
+class MockBackend:
+    def __init__(
+        self, latency=0.0, jitter=0.0, token_latency=0.0, error_rate=0.0, seed=0, script=None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.script = load_script(script) if script else []
+        self.cache = PrefixCache()
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def reply(self, body):
+        prompt = (body.get("messages") or [{}])[-1].get("content") or ""
+        for pattern, response in self.script:
+            if pattern.search(prompt):
+                return response
+        return rule_reply(body, random.Random(request_seed(body, self.seed)))
+
+    def complete(self, body):
+        # Returns (status, payload, seconds to wait before answering).
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            if fail:
+                self.errors += 1
+                status = self._rng.choice((429, 500, 503))
+        if fail:
+            error = {"message": "Injected error from the mock server", "type": "server_error", "code": status}
+            return status, {"error": error}, delay
+        content = self.reply(body)
+        prompt_tokens, cached_tokens = self.cache.lookup(body.get("messages") or [])
+        completion_tokens = count_tokens(content)
+        payload = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or "mock",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+        return 200, payload, delay + completion_tokens * self.token_latency
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        try:
+            body = json.loads(body)
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": {"message": "The request body is not JSON"}})
+            return
+        status, payload, delay = self.server.backend.complete(body)
+        if delay > 0:
+            time.sleep(delay)
+        self.send_json(status, payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8000, verbose=False, **backend_kwargs):
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.backend = MockBackend(**backend_kwargs)
+    server.verbose = verbose
+    return server
+
+
+def start_mock_server(host="127.0.0.1", port=0, **backend_kwargs):
+    # Serves from a daemon thread; port 0 picks a free port. Returns the server and the base
+    # URL to use as OPENAI_BASE_URL.
+    server = make_server(host, port, **backend_kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--host", default="127.0.0.1", type=str, help="Address to listen on")
+    parser.add_argument("--port", default=8000, type=int, help="Port to listen on")
+    parser.add_argument("--latency", default=0.0, type=float, help="Seconds every response takes")
+    parser.add_argument("--jitter", default=0.0, type=float, help="Up to this many extra seconds, drawn uniformly per request")
+    parser.add_argument("--token_latency", default=0.0, type=float, help="Extra seconds per completion token")
+    parser.add_argument("--error_rate", default=0.0, type=float, help="Fraction of requests answered with a 429, 500 or 503 error")
+    parser.add_argument("--seed", default=0, type=int, help="Seed for the rule-based answers and the injected errors")
+    parser.add_argument("--script", default=None, type=str, help="JSON list of {pattern, response} rules tried before the built-in ones")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        verbose=args.verbose,
+        latency=args.latency,
+        jitter=args.jitter,
+        token_latency=args.token_latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        script=args.script,
+    )
+    print(f"Mock OpenAI server on http://{args.host}:{server.server_address[1]}/v1")
+    print(f"Run the simulator with OPENAI_BASE_URL=http://{args.host}:{server.server_address[1]}/v1 OPENAI_API_KEY=mock")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        backend = server.backend
+        print(f"Served {backend.requests} requests, {backend.errors} injected errors")
+        server.server_close()
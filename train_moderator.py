@@ -0,0 +1,41 @@
+from agents.moderation import EndClassifier, cross_validate, session_contexts, unique_sessions
+import json
+import argparse
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--profile_path", default="./annotations/profiles.jsonl", type=str, help="Path to the profiles.jsonl file"
+    )
+    parser.add_argument("--output", default="./moderator.json", type=str, help="Where to write the trained end-of-session classifier")
+    parser.add_argument("--l2", default=1.0, type=float, help="L2 regularization strength")
+    parser.add_argument(
+        "--tolerance", default=0.05, type=float, help="Fraction of held-out windows allowed on the wrong side of each confidence threshold"
+    )
+
+    args = parser.parse_args()
+
+    with open(args.profile_path) as f:
+        sessions = unique_sessions([json.loads(line) for line in f])
+
+    probabilities, labels = cross_validate(sessions, l2=args.l2)
+    classifier = EndClassifier.fit(
+        [window for session in sessions for window in session_contexts(session)], l2=args.l2
+    )
+    classifier.calibrate(probabilities, labels, tolerance=args.tolerance)
+    classifier.save(args.output)
+
+    decided = [
+        (p >= classifier.upper, label)
+        for p, label in zip(probabilities, labels)
+        if p >= classifier.upper or p <= classifier.lower
+    ]
+    correct = sum(prediction == label for prediction, label in decided)
+    print(f"Trained on {len(labels)} windows from {len(sessions)} sessions, wrote {args.output}")
+    print(
+        f"Held-out: {len(decided) / len(labels):.1%} of windows decided locally "
+        f"(lower={classifier.lower:.3f}, upper={classifier.upper:.3f}), "
+        f"{correct / max(len(decided), 1):.1%} of those correct"
+    )